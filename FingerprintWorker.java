@@ -0,0 +1,70 @@
+import com.blackduck.fingerprinter.FingerprintApi;
+
+import java.io.BufferedReader;
+import java.io.FileDescriptor;
+import java.io.FileOutputStream;
+import java.io.FileReader;
+import java.io.IOException;
+import java.io.InputStreamReader;
+import java.io.PrintStream;
+import java.nio.charset.StandardCharsets;
+
+/**
+ * Long-lived fingerprinting worker. Reads one file path per line from stdin and
+ * writes one fingerprint json line per path to stdout, so that a single JVM can
+ * fingerprint any number of files. Run with the java source launcher:
+ * java -cp "snippet-scanner-1.0-SNAPSHOT.jar:sca-fingerprint-client-1.0.0.jar" FingerprintWorker.java
+ */
+public class FingerprintWorker {
+
+    public static void main(String[] args) throws IOException {
+        PrintStream out = new PrintStream(new FileOutputStream(FileDescriptor.out), false, "UTF-8");
+        // Anything else printed to System.out would break the one response per line protocol
+        System.setOut(System.err);
+        FingerprintApi api = new FingerprintApi();
+        BufferedReader in = new BufferedReader(new InputStreamReader(System.in, StandardCharsets.UTF_8));
+        String path;
+        while ((path = in.readLine()) != null) {
+            if (path.isEmpty()) {
+                continue;
+            }
+            String line;
+            try {
+                String fingerprints = api.plaintextToFingerprints(readFile(path));
+                // Json has no literal line breaks inside strings, so this keeps one response per line
+                line = fingerprints == null ? "null" : fingerprints.replace("\r", "").replace("\n", "");
+            } catch (Throwable t) {
+                line = "{\"error\":\"" + escape(String.valueOf(t)) + "\"}";
+            }
+            out.println(line);
+            out.flush();
+        }
+    }
+
+    // Same reading as com.blackduck.snippet.App so that the fingerprints are identical
+    private static String readFile(String path) throws IOException {
+        StringBuilder content = new StringBuilder();
+        try (BufferedReader reader = new BufferedReader(new FileReader(path))) {
+            String line;
+            while ((line = reader.readLine()) != null) {
+                content.append(line);
+                content.append(System.lineSeparator());
+            }
+        }
+        return content.toString();
+    }
+
+    private static String escape(String value) {
+        StringBuilder escaped = new StringBuilder();
+        for (char c : value.toCharArray()) {
+            if (c == '"' || c == '\\') {
+                escaped.append('\\').append(c);
+            } else if (c < 0x20) {
+                escaped.append(String.format("\\u%04x", (int) c));
+            } else {
+                escaped.append(c);
+            }
+        }
+        return escaped.toString();
+    }
+}
@@ -3,10 +3,21 @@ import sys
 import os
 import json
 import argparse
-import subprocess
-from blackduck.HubRestApi import HubInstance
+import tempfile
+import threading
+from collections import deque
+from itertools import chain
+from typing import Iterator
+from concurrent.futures import ThreadPoolExecutor, Future
 from timeit import default_timer as timer
 from snippetGithubCommenter import GihubCommenter
+from fingerprintWorker import FingerprintWorkerPool, fingerprintWithNewJvm
+from snippetCache import SnippetCache, hashFile
+from fingerprintPrefilter import FingerprintPrefilter
+from snippetResultWriter import NdjsonResultWriter, SarifResultWriter, SummaryMarkdownWriter
+from scanMetrics import metrics, ScanProfiler
+from snippetShards import parseShard, selectShard, mergePartialResults
+from snippetWindows import getChangedRanges, readLines, writeWindow, offsetRegions, mergeResults
 
 __author__ = "Jouni Lehto"
 __versionro__ = "0.0.1"
@@ -19,8 +30,16 @@ class SnippetScanner:
     :param url: BD Url
     :param token BD Access Token
     :param log_level: Logging level
+    :param bdMaxConcurrency: Max number of concurrent snippet-matching requests per Black Duck server
+    :param maxRetries: How many times snippet-matching is retried when server responds with 429, 502, 503 or 504
+    :param compressRequests: Snippet-matching request bodies are gzip compressed if the server accepts it
+    :param cache: Optional cache for fingerprints and snippet-matching results
+    :param listingMode: How all files are listed when no pull request is given (tree, contents or local)
+    :param fetchConcurrency: Number of concurrent downloads of changed pull request files
+    :param archiveThreshold: When more changed files than this are missing locally, they are taken from one archive download
+    :param batchComments: Pull request comments are merged and posted from a background thread, earlier comments are updated
     '''
-    def __init__(self, url:str, token:str, giturl:str, gittoken:str, repo:str, prID:int, group:bool, toolNameforSarif:str, log_level:str) -> None:
+    def __init__(self, url:str, token:str, giturl:str, gittoken:str, repo:str, prID:int, group:bool, toolNameforSarif:str, log_level:str, bdMaxConcurrency:int=8, maxRetries:int=5, compressRequests:bool=False, cache:SnippetCache=None, listingMode:str="tree", fetchConcurrency:int=8, archiveThreshold:int=200, batchComments:bool=True) -> None:
         logging.basicConfig(format='%(asctime)s:%(levelname)s:%(module)s: %(message)s', stream=sys.stderr, level=log_level)
         logging.getLogger("requests").setLevel(logging.WARNING)
         logging.getLogger("urllib3").setLevel(logging.WARNING)
@@ -34,48 +53,189 @@ class SnippetScanner:
         url = url if not url.endswith("/") else url[:-1]
         self.url = url
         self.token = token
-        if token:
-            self.hub = HubInstance(url, api_token=token, insecure=True)
-        if gittoken:
-            self.gitcommenter = GihubCommenter(gittoken=gittoken, giturl=giturl, repo=repo, prID=prID, group=group, toolNameforSarif=toolNameforSarif,  log_level=log_level, version=__versionro__)
+        self.gitcommenter = GihubCommenter(gittoken=gittoken, giturl=giturl, repo=repo, prID=prID, group=group, toolNameforSarif=toolNameforSarif,  log_level=log_level, version=__versionro__, listingMode=listingMode, fetchConcurrency=fetchConcurrency, archiveThreshold=archiveThreshold, batchComments=batchComments)
+        self.fingerprintPool = None
+        # Black Duck authentication is done when the first file is sent to snippet-matching
+        self.matchingClient = None
+        self.matchingClientLock = threading.Lock()
+        self.bdMaxConcurrency = bdMaxConcurrency
+        self.maxRetries = maxRetries
+        self.compressRequests = compressRequests
+        self.cache = cache
+
+    def __getMatchingClient(self):
+        with self.matchingClientLock:
+            if not self.matchingClient:
+                # requests and blackduck are imported only when Black Duck is called
+                from blackduck.HubRestApi import HubInstance
+                from snippetMatchingClient import SnippetMatchingClient
+                self.hub = HubInstance(self.url, api_token=self.token, insecure=True)
+                self.matchingClient = SnippetMatchingClient(self.hub, self.url, maxConcurrency=self.bdMaxConcurrency, maxRetries=self.maxRetries, compress=self.compressRequests)
+            return self.matchingClient
 
     def __hashFileContent(self, file:str, action_path:str) -> str:
-        p = subprocess.Popen(f"java -cp \"{action_path}/snippet-scanner-1.0-SNAPSHOT.jar{os.pathsep}{action_path}/sca-fingerprint-client-1.0.0.jar\" com.blackduck.snippet.App \"{file}\"", stdout=subprocess.PIPE, shell=True)
-        output, err = p.communicate()
-        if err:
-            logging.error(err)
-        if output:
-            return json.loads(output.decode())
-        return None
+        if self.fingerprintPool:
+            return self.fingerprintPool.fingerprint(file)
+        return fingerprintWithNewJvm(file, action_path)
     
     def __sendSnippet(self, fingerprints) -> dict:
         if fingerprints:
-            api = f"{args.url}/api/snippet-matching"
-            headers = self.hub.get_headers()
-            headers["Content-Type"] = "application/vnd.blackducksoftware.bill-of-materials-6+json"
-            response = self.hub.execute_post(url=api, data=fingerprints, custom_headers=headers)
-            return response.json()
-
-    def anylyzeSnippets(self, prComment:bool, action_path:str) -> None:
-        analysisFiles = snippetScanner.gitcommenter.analysisFiles
+            return self.__getMatchingClient().match(fingerprints)
+
+    def anylyzeSnippets(self, prComment:bool, action_path:str, fingerprintWorkers:int=1, matchingConcurrency:int=4, incremental:bool=False, contextLines:int=20, resultWriters:list=None, prefilter:FingerprintPrefilter=None) -> None:
+        '''
+        Files are handled in a pipeline: fingerprinting and snippet-matching are run in their own
+        thread pools and the results are collected in the same order as the files were given.
+
+        :param fingerprintWorkers: Number of long-lived fingerprint JVMs, 0 will start a new JVM for each file.
+        :param matchingConcurrency: Number of concurrent snippet-matching requests.
+        :param incremental: Only changed pull request hunks are analyzed and too big files are split into windows.
+        :param contextLines: Number of lines around the changed hunks which are analyzed in incremental mode.
+        :param resultWriters: Results are given to these writers as soon as a file is analyzed, instead of returning them.
+        :param prefilter: Skips files which cannot produce snippet matches before they are fingerprinted.
+        '''
+        # Files are analyzed while they are listed, fingerprint workers are started when the first file is known
+        analysisFiles = iter(self.gitcommenter.analysisFiles)
+        firstFile = next(analysisFiles, None)
         analysisResults = {}
-        if analysisFiles and len(analysisFiles) > 0:
-            for analysisFile in analysisFiles:
-                logging.debug(f"Analyzing file: {analysisFile}")
-                hashes = self.__hashFileContent(analysisFile, action_path)
-                #Code fingerprints must be between 8 and 35000
-                if hashes and "fingerprints" in hashes and len(hashes["fingerprints"])>=8 and len(hashes["fingerprints"])<=3500:
-                    results = self.__sendSnippet(hashes)
-                    if results and "snippetMatches" in results and len(results["snippetMatches"]) > 0:
-                        if prComment:
-                            snippetScanner.gitcommenter.createMarkdownComment(analysisFile, results)
-                        else:
-                            analysisResults[analysisFile]=results
-                elif hashes and "fingerprints" in hashes and len(hashes["fingerprints"]) < 8:
-                    logging.error(f"File {analysisFile} was too small for snippet analysis!")
-                elif hashes and "fingerprints" in hashes and len(hashes["fingerprints"]) > 3500:
-                    logging.error(f"File {analysisFile} was too big for snippet analysis!")
+        if firstFile is not None:
+            analysisFiles = chain([firstFile], analysisFiles)
+            self.incremental = incremental
+            self.contextLines = contextLines
+            self.resultWriters = resultWriters
+            self.prefilter = prefilter
+            if fingerprintWorkers > 0:
+                self.fingerprintPool = FingerprintWorkerPool(action_path, size=fingerprintWorkers)
+            succeeded = False
+            try:
+                with tempfile.TemporaryDirectory(prefix="snippet-windows-") as self.windowDirectory:
+                    self.__analyzeFiles(analysisFiles, prComment, action_path, analysisResults, max(1, fingerprintWorkers), max(1, matchingConcurrency))
+                succeeded = True
+            finally:
+                if self.fingerprintPool:
+                    self.fingerprintPool.close()
+                    self.fingerprintPool = None
+                if self.matchingClient:
+                    self.matchingClient.close()
+                    self.matchingClient = None
+                if prComment:
+                    # Comments of the earlier runs are removed only when the whole scan succeeded
+                    self.gitcommenter.closeComments(removeUnused=succeeded)
+        elif prComment:
+            # Nothing to analyze, comments of the earlier runs are removed
+            self.gitcommenter.closeComments()
         return analysisResults
+
+    def __analyzeFiles(self, analysisFiles:Iterator[str], prComment:bool, action_path:str, analysisResults:dict, fingerprintConcurrency:int, matchingConcurrency:int) -> None:
+        # Bounded number of files in flight, so that the queues won't grow with the repository size
+        maxPending = 4 * (fingerprintConcurrency + matchingConcurrency)
+        pending = deque()
+        fingerprintFile = self.__fingerprintWindows if self.incremental else self.__fingerprintFile
+        with ThreadPoolExecutor(max_workers=fingerprintConcurrency, thread_name_prefix="fingerprint") as fingerprintExecutor, \
+                ThreadPoolExecutor(max_workers=matchingConcurrency, thread_name_prefix="matching") as matchingExecutor:
+            for analysisFile in analysisFiles:
+                pending.append((analysisFile, fingerprintExecutor.submit(fingerprintFile, analysisFile, action_path, matchingExecutor)))
+                if len(pending) >= maxPending:
+                    self.__collectResult(*pending.popleft(), prComment, analysisResults)
+            while pending:
+                self.__collectResult(*pending.popleft(), prComment, analysisResults)
+
+    def __getFingerprints(self, file:str, action_path:str, contentHash:str=None) -> tuple:
+        hashes = None
+        try:
+            if self.cache:
+                contentHash = contentHash if contentHash else hashFile(file)
+                hashes = self.cache.getFingerprints(contentHash)
+            if not hashes:
+                with metrics.stage("fingerprinting") as record:
+                    record.bytesSent = os.path.getsize(file)
+                    hashes = self.__hashFileContent(file, action_path)
+                if self.cache and hashes:
+                    self.cache.putFingerprints(contentHash, hashes)
+        except OSError as e:
+            # Listed file which is not in the workspace, for example from another branch
+            logging.error(f"File {file} could not be read, skipping it: {e}")
+            return contentHash, None
+        return contentHash, hashes
+
+    def __submitMatching(self, contentHash:str, hashes:dict, matchingExecutor:ThreadPoolExecutor) -> Future:
+        if self.cache:
+            results = self.cache.getMatches(self.url, contentHash)
+            if results:
+                future = Future()
+                future.set_result(results)
+                return future
+            return matchingExecutor.submit(self.__sendCachedSnippet, contentHash, hashes)
+        return matchingExecutor.submit(self.__sendSnippet, hashes)
+
+    def __prefilterFile(self, analysisFile:str) -> tuple:
+        if self.prefilter:
+            with metrics.stage("prefilter"):
+                return self.prefilter.check(analysisFile)
+        return None, None
+
+    def __fingerprintFile(self, analysisFile:str, action_path:str, matchingExecutor:ThreadPoolExecutor) -> list:
+        logging.debug(f"Analyzing file: {analysisFile}")
+        skipReason, contentHash = self.__prefilterFile(analysisFile)
+        if skipReason:
+            return []
+        contentHash, hashes = self.__getFingerprints(analysisFile, action_path, contentHash)
+        #Code fingerprints must be between 8 and 35000
+        if hashes and "fingerprints" in hashes and len(hashes["fingerprints"])>=8 and len(hashes["fingerprints"])<=3500:
+            return [(0, self.__submitMatching(contentHash, hashes, matchingExecutor))]
+        elif hashes and "fingerprints" in hashes and len(hashes["fingerprints"]) < 8:
+            logging.error(f"File {analysisFile} was too small for snippet analysis!")
+        elif hashes and "fingerprints" in hashes and len(hashes["fingerprints"]) > 3500:
+            logging.error(f"File {analysisFile} was too big for snippet analysis!")
+        return []
+
+    def __fingerprintWindows(self, analysisFile:str, action_path:str, matchingExecutor:ThreadPoolExecutor) -> list:
+        logging.debug(f"Analyzing file: {analysisFile}")
+        if self.__prefilterFile(analysisFile)[0]:
+            return []
+        try:
+            lines = readLines(analysisFile)
+        except OSError as e:
+            logging.error(f"File {analysisFile} could not be read, skipping it: {e}")
+            return []
+        patch = self.gitcommenter.filePatches.get(analysisFile)
+        windows = deque(getChangedRanges(patch, self.contextLines, len(lines)) if patch else [(1, len(lines))])
+        matchings = []
+        while windows:
+            start, end = windows.popleft()
+            windowFile = writeWindow(lines, start, end, self.windowDirectory, f"{threading.get_ident()}-{os.path.basename(analysisFile)}")
+            contentHash, hashes = self.__getFingerprints(windowFile, action_path)
+            if not hashes or not "fingerprints" in hashes:
+                continue
+            #Code fingerprints must be between 8 and 35000, too big windows are split in half
+            if len(hashes["fingerprints"]) > 3500 and end > start:
+                middle = (start + end) // 2
+                windows.extendleft([(middle + 1, end), (start, middle)])
+            elif len(hashes["fingerprints"]) >= 8 and len(hashes["fingerprints"]) <= 3500:
+                matchings.append((start - 1, self.__submitMatching(contentHash, hashes, matchingExecutor)))
+            else:
+                logging.debug(f"Lines {start}-{end} of file {analysisFile} were too small for snippet analysis.")
+        return matchings
+
+    def __sendCachedSnippet(self, contentHash:str, fingerprints:dict) -> dict:
+        results = self.__sendSnippet(fingerprints)
+        if results and "snippetMatches" in results:
+            self.cache.putMatches(self.url, contentHash, results)
+        return results
+
+    def __collectResult(self, analysisFile:str, fingerprintFuture:Future, prComment:bool, analysisResults:dict) -> None:
+        # Each file has one snippet-matching per analyzed window, line offset of the window and the matching
+        matchings = fingerprintFuture.result()
+        results = mergeResults([offsetRegions(matchingFuture.result(), offset) for offset, matchingFuture in matchings])
+        if results and "snippetMatches" in results and len(results["snippetMatches"]) > 0:
+            if prComment:
+                self.gitcommenter.createMarkdownComment(analysisFile, results)
+            elif self.resultWriters:
+                with metrics.stage("report"):
+                    for resultWriter in self.resultWriters:
+                        resultWriter.write(analysisFile, results)
+            else:
+                analysisResults[analysisFile]=results
     
 def str2bool(v):
     return v.lower() in ("yes", "true", "t", "1")
@@ -98,25 +258,107 @@ if __name__ == "__main__":
         parser.add_argument('--action_path', help="Path where actions are downloaded", required=True)
         parser.add_argument('--result_file', help="File for result json", default="blackduckSnippetFindings.json", required=False)
         parser.add_argument('--group', help="Will create only one groupped comment per file.", default=True, type=str2bool)
+        parser.add_argument('--batchComments', help="Will merge Pull Request Comments into as few comments as possible and update the comments of earlier runs.", default=True, type=str2bool)
         parser.add_argument('--prComment', help="Will create Pull Request Comments, otherwise json exported.", default=False, type=str2bool)
         parser.add_argument('--sarif', help="Will create sarif format file.", default=False, type=str2bool)
+        parser.add_argument('--streamResults', help="Will write results as soon as files are analyzed, json results are written as one json line per file.", default=False, type=str2bool)
+        parser.add_argument('--compactSarif', help="Will write sarif without indentation and with a deduplicated artifacts table.", default=False, type=str2bool)
         parser.add_argument('--toolNameforSarif', help="Tool name in Sarif json", default="Black Duck Snippet", required=False)
+        parser.add_argument('--matchingConcurrency', help="Number of concurrent snippet-matching requests.", default=4, type=int)
+        parser.add_argument('--bdMaxConcurrency', help="Max number of concurrent snippet-matching requests per Black Duck server.", default=8, type=int)
+        parser.add_argument('--listingMode', help="How all files are listed without --prID: tree (one git trees call), contents (contents API walk) or local (local checkout).", default="tree", choices=["tree", "contents", "local"])
+        parser.add_argument('--fetchConcurrency', help="Number of concurrent downloads of changed pull request files.", default=8, type=int)
+        parser.add_argument('--archiveThreshold', help="When more changed pull request files than this are missing locally, they are taken from one archive download.", default=200, type=int)
+        parser.add_argument('--incremental', help="Will analyze only the changed pull request hunks and split too big files into windows.", default=False, type=str2bool)
+        parser.add_argument('--contextLines', help="Number of lines around the changed hunks which are analyzed in incremental mode.", default=20, type=int)
+        parser.add_argument('--cacheFile', help="SQLite file for caching fingerprints and snippet-matching results between runs.", required=False)
+        parser.add_argument('--cacheTTL', help="Time to live for the cached results in hours.", default=168, type=int)
+        parser.add_argument('--cacheMaxSize', help="Max size of the cache in MB.", default=500, type=int)
+        parser.add_argument('--compressRequests', help="Will gzip compress snippet-matching requests if Black Duck accepts it.", default=False, type=str2bool)
+        parser.add_argument('--fingerprintWorkers', help="Number of long-lived fingerprinting JVMs, 0 will start a new JVM for each file.", default=1, type=int)
+        parser.add_argument('--prefilter', help="Will skip empty, binary, generated, minified, too small or too big, unreadable and allowlisted files before fingerprinting.", default=False, type=str2bool)
+        parser.add_argument('--cleanAllowlist', help="File with sha256 hashes of known-clean file contents (one per line), used by --prefilter.", required=False)
+        parser.add_argument('--skippedFilesReport', help="File for json report of the files which --prefilter skipped and why.", required=False)
+        parser.add_argument('--metricsFile', help="File for per-stage timing metrics json, the metrics table is also added to snippet_results.md.", required=False)
+        parser.add_argument('--profile', help="Will dump a cProfile of all threads (cprofile) or a Chrome trace-event file (trace) of the run.", default="none", choices=["none", "cprofile", "trace"])
+        parser.add_argument('--profileFile', help="File for the profile, default is snippet_profile.prof or snippet_trace.json.", required=False)
+        parser.add_argument('--shard', help="Will analyze only the given part i/N (i is 1..N) of the files and write the partial results as json, for example 2/4.", required=False)
+        parser.add_argument('--shardBySize', help="Will partition the files of --shard by file size, so that every shard gets about the same amount of content.", default=False, type=str2bool)
+        parser.add_argument('--mergeResults', help="Partial json results of the shards, which are merged into one report (sarif, json or Pull Request Comments) without analyzing files.", nargs="+", required=False)
 
         args = parser.parse_args()
 
-        snippetScanner = SnippetScanner(args.url, args.token, args.giturl, args.gittoken, args.repo, args.prID, args.group, args.toolNameforSarif, args.log_level)
-        results = snippetScanner.anylyzeSnippets(args.prComment, args.action_path)
-        if not args.prComment:
-            if args.sarif:
-                output_results = snippetScanner.gitcommenter.createSarif(results, args.url)
-            else:
-                output_results = results
-            with open(args.result_file, "w", encoding="UTF-8") as f:
-                f.write(json.dumps(output_results, indent=3))
-            with open("snippet_results.md", "w", encoding="UTF-8") as snippetFile:
-                snippetFile.write(snippetScanner.gitcommenter.createSummaryMarkdown(results))
+        profiler = None
+        if args.profile == "cprofile":
+            profiler = ScanProfiler()
+            profiler.start()
+        elif args.profile == "trace":
+            metrics.enableTracing()
+
+        cache = None
+        prefilter = None
+        resultWriters = None
+        # Shards write partial json results, the report (sarif or comments) is created when they are merged
+        prComment = args.prComment and not args.shard
+        sarif = args.sarif and not args.shard
+        if args.mergeResults:
+            gitcommenter = GihubCommenter(args.giturl, args.gittoken, args.repo, args.prID, args.group, args.toolNameforSarif, args.log_level, __versionro__, batchComments=args.batchComments)
+            results = mergePartialResults(args.mergeResults)
+            logging.info(f"Merged results of {len(results)} files from {len(args.mergeResults)} shards.")
+            if prComment:
+                for file, result in results.items():
+                    gitcommenter.createMarkdownComment(file, result)
+                gitcommenter.closeComments()
+        else:
+            shardIndex, shardCount = parseShard(args.shard) if args.shard else (None, None)
+            if args.shard and (args.prComment or args.sarif):
+                logging.info("Shard results are written as json, Pull Request Comments and sarif are created with --mergeResults.")
+            cache = SnippetCache(args.cacheFile, ttl=args.cacheTTL*60*60, maxSize=args.cacheMaxSize*1024*1024) if args.cacheFile else None
+            snippetScanner = SnippetScanner(args.url, args.token, args.giturl, args.gittoken, args.repo, args.prID, args.group, args.toolNameforSarif, args.log_level, bdMaxConcurrency=args.bdMaxConcurrency, compressRequests=args.compressRequests, cache=cache, listingMode=args.listingMode, fetchConcurrency=args.fetchConcurrency, archiveThreshold=args.archiveThreshold, batchComments=args.batchComments)
+            gitcommenter = snippetScanner.gitcommenter
+            if args.shard:
+                gitcommenter.analysisFiles = selectShard(gitcommenter.analysisFiles, shardIndex, shardCount, args.shardBySize)
+            if args.streamResults and not prComment:
+                resultWriters = [SarifResultWriter(args.result_file, gitcommenter, args.url, args.compactSarif) if sarif else NdjsonResultWriter(args.result_file)]
+                resultWriters.append(SummaryMarkdownWriter("snippet_results.md", gitcommenter))
+            # Too big files are split into windows in incremental mode, so they are not skipped
+            prefilter = FingerprintPrefilter(args.cleanAllowlist, maxLines=None if args.incremental else 7000) if args.prefilter else None
+            results = snippetScanner.anylyzeSnippets(prComment, args.action_path, args.fingerprintWorkers, args.matchingConcurrency, args.incremental, args.contextLines, resultWriters, prefilter)
+        if prefilter:
+            prefilter.logStatistics()
+            if args.skippedFilesReport:
+                prefilter.writeReport(args.skippedFilesReport)
+        with metrics.stage("report"):
+            if resultWriters:
+                for resultWriter in resultWriters:
+                    resultWriter.close()
+            elif not prComment:
+                if sarif:
+                    output_results = gitcommenter.createSarif(results, args.url, args.compactSarif)
+                else:
+                    output_results = results
+                with open(args.result_file, "w", encoding="UTF-8") as f:
+                    if sarif and args.compactSarif:
+                        json.dump(output_results, f, separators=(",", ":"))
+                    else:
+                        f.write(json.dumps(output_results, indent=3))
+                with open("snippet_results.md", "w", encoding="UTF-8") as snippetFile:
+                    snippetFile.write(gitcommenter.createSummaryMarkdown(results))
+        if cache:
+            cache.logStatistics()
+            cache.close()
         end = timer()
         usedTime = end - start
+        metrics.record("total", start, usedTime)
+        if args.metricsFile:
+            metrics.writeJson(args.metricsFile)
+            with open("snippet_results.md", "a", encoding="UTF-8") as snippetFile:
+                snippetFile.write(f"\n{metrics.createMarkdown()}")
+        if profiler:
+            profiler.stop()
+            profiler.dumpStats(args.profileFile if args.profileFile else "snippet_profile.prof")
+        elif args.profile == "trace":
+            metrics.writeTrace(args.profileFile if args.profileFile else "snippet_trace.json")
         logging.info(f"Took: {usedTime} seconds.")
         logging.info("Done")
     except Exception as e:
@@ -0,0 +1,78 @@
+import types
+
+__author__ = "Jouni Lehto"
+
+class FakeList(list):
+
+    '''
+    List with the totalCount of PyGithub PaginatedList.
+    '''
+    @property
+    def totalCount(self) -> int:
+        return len(self)
+
+class FakeComment:
+
+    def __init__(self, pullRequest, body:str) -> None:
+        self.pullRequest = pullRequest
+        self.body = body
+
+    def edit(self, body:str) -> None:
+        self.pullRequest.writes += 1
+        self.body = body
+
+    def delete(self) -> None:
+        self.pullRequest.writes += 1
+        self.pullRequest.comments.remove(self)
+
+class FakePullRequest:
+
+    def __init__(self, files:list) -> None:
+        self.head = types.SimpleNamespace(sha="0" * 40)
+        self.comments = []
+        self.writes = 0
+        self.files = FakeList([types.SimpleNamespace(filename=file, status="modified", changes=10, additions=10, deletions=0, sha=f"{index:040d}",
+                                                     patch="@@ -1,10 +1,10 @@") for index, file in enumerate(files)])
+
+    def get_files(self) -> FakeList:
+        return self.files
+
+    def get_issue_comments(self) -> FakeList:
+        return FakeList(self.comments)
+
+    def create_issue_comment(self, body:str) -> FakeComment:
+        self.writes += 1
+        comment = FakeComment(self, body)
+        self.comments.append(comment)
+        return comment
+
+class FakeRepository:
+
+    def __init__(self, files:list) -> None:
+        self.files = files
+        self.default_branch = "main"
+        self.html_url = "https://github.com/benchmark/repo"
+        self.pullRequest = FakePullRequest(files)
+
+    def get_git_tree(self, sha:str, recursive:bool=False):
+        tree = [types.SimpleNamespace(path=file, type="blob", sha=f"{index:040d}") for index, file in enumerate(self.files)]
+        return types.SimpleNamespace(sha=sha, truncated=False, tree=tree)
+
+    def get_pull(self, number:int) -> FakePullRequest:
+        return self.pullRequest
+
+class FakeGithub:
+
+    '''
+    Stand-in for github.Github with the calls which GihubCommenter makes. Files of the
+    repository (and of the pull request) are given to the class before the scanner is created.
+    '''
+    files = []
+    rate_limiting = (5000, 5000)
+    rate_limiting_resettime = 0
+
+    def __init__(self, *args, **kwargs) -> None:
+        self.repository = FakeRepository(FakeGithub.files)
+
+    def get_repo(self, name:str, lazy:bool=False) -> FakeRepository:
+        return self.repository
@@ -0,0 +1,48 @@
+'''
+Compares fingerprinting with one JVM per file against the long-lived fingerprint workers.
+Needs java (11+) and the snippet-scanner jars in --action_path.
+'''
+import os
+import sys
+import tempfile
+import argparse
+from timeit import default_timer as timer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fingerprintWorker import FingerprintWorkerPool, fingerprintWithNewJvm
+from synthetic_repo import createSyntheticTree
+
+__author__ = "Jouni Lehto"
+
+def benchmarkNewJvm(files:list, action_path:str) -> float:
+    start = timer()
+    for file in files:
+        fingerprintWithNewJvm(file, action_path)
+    return timer() - start
+
+def benchmarkWorkers(files:list, action_path:str, workers:int) -> float:
+    from concurrent.futures import ThreadPoolExecutor
+    start = timer()
+    with FingerprintWorkerPool(action_path, size=workers) as pool:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(pool.fingerprint, files))
+    return timer() - start
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fingerprint worker benchmark.")
+    parser.add_argument('--action_path', help="Path where the snippet-scanner jars are", required=True)
+    parser.add_argument('--sizes', help="Comma separated list of file counts", default="1000,5000,10000")
+    parser.add_argument('--workers', help="Comma separated list of worker pool sizes", default="1,4")
+    parser.add_argument('--skipNewJvm', help="Skip the one JVM per file run, it is slow with big trees", action="store_true")
+    args = parser.parse_args()
+    print("| Files | Mode | Seconds | Files/s |")
+    print("| ----- | ---- | ------- | ------- |")
+    for size in [int(size) for size in args.sizes.split(",")]:
+        with tempfile.TemporaryDirectory() as root:
+            files = [os.path.join(root, file) for file in createSyntheticTree(root, size)]
+            if not args.skipNewJvm:
+                took = benchmarkNewJvm(files, args.action_path)
+                print(f"| {size} | JVM per file | {took:.2f} | {size/took:.1f} |")
+            for workers in [int(workers) for workers in args.workers.split(",")]:
+                took = benchmarkWorkers(files, args.action_path, workers)
+                print(f"| {size} | {workers} worker(s) | {took:.2f} | {size/took:.1f} |")
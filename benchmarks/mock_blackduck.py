@@ -0,0 +1,94 @@
+import json
+import gzip
+import time
+import random
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+__author__ = "Jouni Lehto"
+
+class MockBlackDuck:
+
+    '''
+    Local stand-in for the Black Duck endpoints which the scanner uses: authentication,
+    version info and snippet-matching.
+
+    :param latency: Seconds which each snippet-matching request takes
+    :param errorRate: Share of snippet-matching requests which get 503 as a response
+    :param matchDensity: Share of snippet-matching requests which get snippet matches
+    '''
+    def __init__(self, latency:float=0.05, errorRate:float=0.0, matchDensity:float=0.1) -> None:
+        self.latency = latency
+        self.errorRate = errorRate
+        self.matchDensity = matchDensity
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.random = random.Random(0)
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.__createHandler())
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = None
+
+    def start(self) -> None:
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def snippetMatching(self, fingerprints:dict) -> tuple:
+        with self.lock:
+            self.requests += 1
+            roll = self.random.random()
+            if roll < self.errorRate:
+                self.errors += 1
+                return 503, {"errorMessage": "Service unavailable"}
+        time.sleep(self.latency)
+        snippetMatches = {}
+        if roll < self.errorRate + self.matchDensity:
+            lineCount = max(10, len(fingerprints.get("fingerprints", [])))
+            snippetMatches["PERMISSIVE"] = [{"projectName": "mock-project", "releaseVersion": "1.0.0", "matchedFilePath": "src/mock.py",
+                "licenseDefinition": {"licenseDisplayName": "MIT License"},
+                "regions": {"sourceStartLines": [1], "sourceEndLines": [lineCount // 2], "matchedStartLines": [10], "matchedEndLines": [10 + lineCount // 2]}}]
+        return 200, {"snippetMatches": snippetMatches, "_meta": {"links": [{"rel": "self", "href": f"{self.url}/api/snippet-matching"}]}}
+
+    def __createHandler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def __send(self, status:int, body:dict, headers:dict={}) -> None:
+                data = json.dumps(body).encode("UTF-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path == "/api/current-version":
+                    self.__send(200, {"version": "2024.10.0"})
+                else:
+                    self.__send(404, {})
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if self.path == "/api/tokens/authenticate":
+                    self.__send(200, {"bearerToken": "mock-bearer-token", "expiresInMilliseconds": 7200000}, {"X-CSRF-TOKEN": "mock-csrf-token"})
+                elif self.path == "/api/snippet-matching":
+                    if self.headers.get("Content-Encoding") == "gzip":
+                        body = gzip.decompress(body)
+                    status, response = mock.snippetMatching(json.loads(body))
+                    self.__send(status, response, {"Retry-After": "0"} if status == 503 else {})
+                else:
+                    self.__send(404, {})
+
+        return Handler
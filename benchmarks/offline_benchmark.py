@@ -0,0 +1,78 @@
+'''
+End to end benchmark of SnippetScanner.anylyzeSnippets without Black Duck, GitHub or a JVM.
+Uses a local mock of the Black Duck API, a fake of the PyGithub calls, a synthetic repository
+and a stub fingerprinter in place of the snippet-scanner jar. Each repository size is run in
+its own process, so that the peak RSS is measured separately for each size.
+'''
+import os
+import sys
+import json
+import resource
+import tempfile
+import argparse
+import subprocess
+from timeit import default_timer as timer
+
+benchmarkPath = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(benchmarkPath))
+
+__author__ = "Jouni Lehto"
+
+def createStubJava(directory:str) -> None:
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, "java")
+    with open(path, "w", encoding="UTF-8") as f:
+        f.write(f'#!/bin/sh\nexec "{sys.executable}" "{os.path.join(benchmarkPath, "stub_java.py")}" "$@"\n')
+    os.chmod(path, 0o755)
+
+def runSingle(args) -> dict:
+    import github
+    from bd_snippet_scanner import SnippetScanner
+    from mock_blackduck import MockBlackDuck
+    from fake_github import FakeGithub
+    from synthetic_repo import createSyntheticTree
+    with tempfile.TemporaryDirectory(prefix="snippet-benchmark-") as root:
+        os.chdir(root)
+        FakeGithub.files = createSyntheticTree(root, args.single)
+        createStubJava(os.path.join(root, ".stub"))
+        os.environ["PATH"] = os.path.join(root, ".stub") + os.pathsep + os.environ["PATH"]
+        github.Github = FakeGithub
+        server = MockBlackDuck(latency=args.latency, errorRate=args.errorRate, matchDensity=args.matchDensity)
+        server.start()
+        try:
+            start = timer()
+            scanner = SnippetScanner(server.url, "benchmark-token", None, "benchmark-token", "benchmark/repo", "1" if args.mode == "pr" else None, True,
+                                     "Black Duck Snippet", "WARNING", bdMaxConcurrency=args.matchingConcurrency, compressRequests=args.compressRequests)
+            results = scanner.anylyzeSnippets(args.mode == "pr", root, args.fingerprintWorkers, args.matchingConcurrency)
+            took = timer() - start
+        finally:
+            server.stop()
+        return {"files": args.single, "seconds": round(took, 2), "filesPerSecond": round(args.single / took, 1), "requests": server.requests,
+                "requestsPerSecond": round(server.requests / took, 1), "errors": server.errors, "matchedFiles": len(results),
+                "peakRssMB": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+                "fingerprinterPeakRssMB": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1)}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline end to end benchmark of the snippet scanner.")
+    parser.add_argument('--sizes', help="Comma separated list of repository sizes (files)", default="100,1000,5000")
+    parser.add_argument('--mode', help="full (all files) or pr (pull request with comments)", default="full", choices=["full", "pr"])
+    parser.add_argument('--latency', help="Seconds per snippet-matching request", default=0.05, type=float)
+    parser.add_argument('--errorRate', help="Share of snippet-matching requests which get 503", default=0.0, type=float)
+    parser.add_argument('--matchDensity', help="Share of snippet-matching requests which get matches", default=0.1, type=float)
+    parser.add_argument('--fingerprintWorkers', help="Number of fingerprint workers, 0 starts a new process for each file", default=1, type=int)
+    parser.add_argument('--matchingConcurrency', help="Number of concurrent snippet-matching requests", default=4, type=int)
+    parser.add_argument('--compressRequests', help="Gzip compressed snippet-matching requests", action="store_true")
+    parser.add_argument('--single', help=argparse.SUPPRESS, type=int)
+    args = parser.parse_args()
+    if args.single:
+        print(json.dumps(runSingle(args)))
+    else:
+        print("| Files | Seconds | Files/s | Requests/s | Errors | Peak RSS (MB) | Fingerprinter peak RSS (MB) |")
+        print("| ----- | ------- | ------- | ---------- | ------ | ------------- | --------------------------- |")
+        for size in [int(size) for size in args.sizes.split(",")]:
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), "--single", str(size)] + sys.argv[1:], capture_output=True, text=True)
+            if output.returncode != 0:
+                print(output.stderr, file=sys.stderr)
+                continue
+            result = json.loads(output.stdout.strip().splitlines()[-1])
+            print(f'| {result["files"]} | {result["seconds"]} | {result["filesPerSecond"]} | {result["requestsPerSecond"]} | {result["errors"]} | {result["peakRssMB"]} | {result["fingerprinterPeakRssMB"]} |')
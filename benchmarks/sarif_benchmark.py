@@ -0,0 +1,53 @@
+'''
+Measures the sarif generation of GihubCommenter with synthetic snippet-matching results.
+Does not need Black Duck or GitHub.
+'''
+import os
+import sys
+import json
+import random
+import argparse
+from timeit import default_timer as timer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from snippetGithubCommenter import GihubCommenter
+
+__author__ = "Jouni Lehto"
+
+licenseFamilies = ["RECIPROCAL", "WEAK_RECIPROCAL", "PERMISSIVE", "UNKNOWN"]
+
+def createCommenter() -> GihubCommenter:
+    # Local listing without a pull request needs no connection to GitHub
+    commenter = GihubCommenter(None, None, "owner/repo", None, True, "Black Duck Snippet", "WARNING", "benchmark", listingMode="local")
+    commenter.commitSha = "0" * 40
+    return commenter
+
+def createResults(matchCount:int, matchesPerFile:int=5) -> dict:
+    random.seed(matchCount)
+    results = {}
+    for fileIndex in range(0, matchCount, matchesPerFile):
+        snippetMatches = {}
+        for matchIndex in range(min(matchesPerFile, matchCount - fileIndex)):
+            snippetMatches.setdefault(random.choice(licenseFamilies), []).append({"projectName": f"project{random.randint(0, 500)}",
+                "releaseVersion": f"1.{random.randint(0, 20)}", "matchedFilePath": f"src/matched{matchIndex}.c",
+                "licenseDefinition": {"licenseDisplayName": f"License {random.randint(0, 200)}"},
+                "regions": {"sourceStartLines": [1, 40], "sourceEndLines": [30, 60], "matchedStartLines": [10, 70], "matchedEndLines": [39, 90]}})
+        results[f"src/dir{fileIndex % 100}/file{fileIndex}.c"] = {"snippetMatches": snippetMatches, "_meta": {"links": [{"href": "https://blackduck.example.com/api/snippet-matching"}]}}
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sarif generation benchmark.")
+    parser.add_argument('--sizes', help="Comma separated list of match counts", default="1000,10000,100000")
+    args = parser.parse_args()
+    commenter = createCommenter()
+    print("| Matches | Mode | Build (s) | Serialize (s) | Size (MB) |")
+    print("| ------- | ---- | --------- | ------------- | --------- |")
+    for size in [int(size) for size in args.sizes.split(",")]:
+        results = createResults(size)
+        for compact in (False, True):
+            start = timer()
+            sarif = commenter.createSarif(results, "https://blackduck.example.com", compact)
+            built = timer()
+            output = json.dumps(sarif, separators=(",", ":")) if compact else json.dumps(sarif, indent=3)
+            serialized = timer()
+            print(f"| {size} | {'compact' if compact else 'default'} | {built-start:.2f} | {serialized-built:.2f} | {len(output)/1024/1024:.1f} |")
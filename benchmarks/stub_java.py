@@ -0,0 +1,26 @@
+'''
+Stand-in for the java command and the snippet-scanner jar. Speaks the same protocol as
+FingerprintWorker.java (paths from stdin, one json line per path) and as com.blackduck.snippet.App
+(one file as an argument), so the scanner can be benchmarked without a JVM.
+Fingerprints are crc32 hashes of the non-empty lines.
+'''
+import sys
+import json
+import zlib
+
+def fingerprint(file:str) -> str:
+    with open(file, "rb") as f:
+        fingerprints = [zlib.crc32(line.strip()) for line in f if line.strip()]
+    return json.dumps({"fingerprints": fingerprints})
+
+if __name__ == "__main__":
+    if any(argument.endswith("FingerprintWorker.java") for argument in sys.argv[1:]):
+        for line in sys.stdin:
+            path = line.rstrip("\n")
+            if path:
+                try:
+                    print(fingerprint(path), flush=True)
+                except OSError as e:
+                    print(json.dumps({"error": str(e)}), flush=True)
+    else:
+        print(fingerprint(sys.argv[-1]))
@@ -0,0 +1,24 @@
+import os
+import random
+
+__author__ = "Jouni Lehto"
+
+def createSyntheticTree(root:str, fileCount:int, minFunctions:int=5, maxFunctions:int=40) -> list:
+    '''
+    Creates fileCount python files under root and returns their paths relative to root.
+    Same fileCount gives always the same content.
+    '''
+    random.seed(fileCount)
+    files = []
+    for index in range(fileCount):
+        directory = f"dir{index % 50}"
+        os.makedirs(os.path.join(root, directory), exist_ok=True)
+        path = f"{directory}/file{index}.py"
+        with open(os.path.join(root, path), "w", encoding="UTF-8") as f:
+            for function in range(random.randint(minFunctions, maxFunctions)):
+                f.write(f"def function_{function}_{index}(value):\n")
+                for line in range(random.randint(2, 10)):
+                    f.write(f"    value = value * {random.randint(1, 1000)} + {line}\n")
+                f.write("    return value\n\n")
+        files.append(path)
+    return files
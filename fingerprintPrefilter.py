@@ -0,0 +1,94 @@
+import logging
+import os
+import re
+import mmap
+import json
+import hashlib
+import threading
+from itertools import islice
+
+__author__ = "Jouni Lehto"
+
+generatedMarkers = re.compile(rb"@generated|DO NOT EDIT|Code generated|auto-generated|autogenerated", re.IGNORECASE)
+# Non-blank lines which have more than brackets and separators
+normalizedLine = re.compile(rb"^[ \t]*[^\s{}()\[\];,]", re.MULTILINE)
+token = re.compile(rb"\w+")
+newline = re.compile(rb"\n")
+
+class FingerprintPrefilter:
+
+    '''
+    Cheap checks which are done before the file is fingerprinted, to skip files which cannot
+    produce snippet matches: empty, binary, generated and minified files, files with too few
+    or too many normalized lines for the 8-3500 fingerprint limit, known-clean files and
+    files which cannot be read.
+    Files are read through mmap, so the content is not copied.
+
+    :param allowlistFile: File with sha256 hashes of known-clean file contents, one per line
+    :param minLines: Files with fewer normalized lines are too small for snippet analysis
+    :param maxLines: Files with more normalized lines are too big for snippet analysis, None will not check it
+    :param minTokens: Files with fewer tokens are too small for snippet analysis
+    :param maxLineLength: Files with longer average line length are treated as minified
+    '''
+    def __init__(self, allowlistFile:str=None, minLines:int=4, maxLines:int=7000, minTokens:int=16, maxLineLength:int=300) -> None:
+        self.minLines = minLines
+        self.minTokens = minTokens
+        self.maxLines = maxLines
+        self.maxLineLength = maxLineLength
+        self.allowlist = set()
+        if allowlistFile:
+            with open(allowlistFile, "r", encoding="UTF-8") as f:
+                self.allowlist = {line.strip().lower() for line in f if line.strip()}
+        self.lock = threading.Lock()
+        self.skipped = {}
+
+    def check(self, file:str) -> tuple:
+        '''
+        Returns the reason why the file is skipped (None if the file should be fingerprinted)
+        and the sha256 of the file content.
+        '''
+        try:
+            if os.path.getsize(file) == 0:
+                return self.__skip(file, "empty"), None
+            with open(file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as content:
+                contentHash = hashlib.sha256(content).hexdigest()
+                reason = self.__getReason(content, contentHash)
+        except OSError as e:
+            logging.error(f"File {file} could not be read, skipping it: {e}")
+            return self.__skip(file, "unreadable"), None
+        return self.__skip(file, reason) if reason else None, contentHash
+
+    def __getReason(self, content:mmap.mmap, contentHash:str) -> str:
+        if contentHash in self.allowlist:
+            return "allowlisted"
+        if content.find(b"\0", 0, 8192) >= 0:
+            return "binary"
+        if generatedMarkers.search(content, 0, 2048):
+            return "generated"
+        lines = sum(1 for _ in newline.finditer(content)) + 1
+        if len(content) / lines > self.maxLineLength:
+            return "minified"
+        # Fingerprint count is estimated by the normalized lines, tokens are counted only up to the minimum
+        normalizedLines = sum(1 for _ in normalizedLine.finditer(content))
+        if normalizedLines < self.minLines or sum(1 for _ in islice(token.finditer(content), self.minTokens)) < self.minTokens:
+            return "too small"
+        if self.maxLines and normalizedLines > self.maxLines:
+            return "too big"
+        return None
+
+    def __skip(self, file:str, reason:str) -> str:
+        logging.debug(f"File {file} skipped before fingerprinting: {reason}")
+        with self.lock:
+            self.skipped[file] = reason
+        return reason
+
+    def logStatistics(self) -> None:
+        reasons = {}
+        for reason in self.skipped.values():
+            reasons[reason] = reasons.get(reason, 0) + 1
+        for reason, count in sorted(reasons.items()):
+            logging.info(f"Prefilter skipped {count} file(s): {reason}.")
+
+    def writeReport(self, reportFile:str) -> None:
+        with open(reportFile, "w", encoding="UTF-8") as f:
+            f.write(json.dumps(self.skipped, indent=3))
@@ -0,0 +1,193 @@
+import logging
+import os
+import json
+import queue
+import threading
+import time
+import subprocess
+from collections import deque
+
+__author__ = "Jouni Lehto"
+
+def getClassPath(action_path:str) -> str:
+    return f"{action_path}/snippet-scanner-1.0-SNAPSHOT.jar{os.pathsep}{action_path}/sca-fingerprint-client-1.0.0.jar"
+
+def fingerprintWithNewJvm(file:str, action_path:str) -> dict:
+    '''
+    Legacy way of fingerprinting, starts a new JVM for the given file.
+    '''
+    p = subprocess.Popen(f"java -cp \"{getClassPath(action_path)}\" com.blackduck.snippet.App \"{file}\"", stdout=subprocess.PIPE, shell=True)
+    output, err = p.communicate()
+    if err:
+        logging.error(err)
+    if output:
+        return json.loads(output.decode())
+    return None
+
+class FingerprintWorkerError(Exception):
+    pass
+
+class FingerprintWorker:
+
+    '''
+    One long-lived JVM (FingerprintWorker.java) which reads file paths from stdin
+    and answers with one fingerprint json line per file. Answers are read by a reader
+    thread, so that a hung JVM times out instead of blocking the fingerprinting thread.
+
+    :param action_path: Path where the snippet-scanner jars and FingerprintWorker.java are
+    :param timeout: Max time in seconds to wait for the answer of one file
+    '''
+    def __init__(self, action_path:str, timeout:float=120) -> None:
+        self.action_path = action_path
+        self.timeout = timeout
+        self.process = None
+        self.output = None
+        # Start times of the restarts within the restart window
+        self.restarts = deque()
+        self.answered = False
+        self.disabled = False
+
+    def start(self) -> None:
+        command = ["java", "-cp", getClassPath(self.action_path), f"{self.action_path}/FingerprintWorker.java"]
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, encoding="UTF-8", bufsize=1)
+        # Each process has its own queue, so that the lines of a stopped process are not read
+        self.output = queue.Queue()
+        threading.Thread(target=self.__readOutput, args=(self.process.stdout, self.output), name="fingerprint-output", daemon=True).start()
+        logging.debug(f"Fingerprint worker started, pid: {self.process.pid}")
+
+    def __readOutput(self, stdout, output:queue.Queue) -> None:
+        try:
+            for line in stdout:
+                output.put(line)
+        except (OSError, ValueError):
+            pass
+        # End of the output, the process has exited
+        output.put("")
+
+    def isAlive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def fingerprint(self, file:str) -> dict:
+        if not self.isAlive():
+            raise FingerprintWorkerError("Fingerprint worker is not running.")
+        try:
+            self.process.stdin.write(f"{file}\n")
+            self.process.stdin.flush()
+            output = self.output.get(timeout=self.timeout)
+        except (BrokenPipeError, OSError) as e:
+            raise FingerprintWorkerError(f"Fingerprint worker failed with file {file}: {e}")
+        except queue.Empty:
+            raise FingerprintWorkerError(f"Fingerprint worker did not answer in {self.timeout} seconds while handling file {file}")
+        if not output:
+            raise FingerprintWorkerError(f"Fingerprint worker exited with code {self.process.poll()} while handling file {file}")
+        self.answered = True
+        try:
+            response = json.loads(output)
+        except json.JSONDecodeError:
+            # Answers are not in sync with the files anymore, so the worker must be restarted
+            raise FingerprintWorkerError(f"Fingerprint worker gave an invalid answer while handling file {file}: {output.strip()[:200]}")
+        if response and "error" in response and not "fingerprints" in response:
+            logging.error(f"Fingerprinting of file {file} failed: {response['error']}")
+            return None
+        return response
+
+    def stop(self, graceful:bool=True) -> None:
+        '''
+        :param graceful: Worker is let to finish, otherwise the failed worker is killed right away
+        '''
+        if self.process:
+            try:
+                if graceful:
+                    self.process.stdin.close()
+                    self.process.wait(timeout=10)
+            except (OSError, subprocess.TimeoutExpired):
+                graceful = False
+            if not graceful:
+                self.process.kill()
+                self.process.wait()
+            self.process = None
+
+class FingerprintWorkerPool:
+
+    '''
+    Pool of long-lived fingerprint workers. Workers are started once and reused for
+    every file, a crashed worker is restarted and the file is tried once again before
+    it is skipped. Workers which cannot be started (no java, or java without the source
+    launcher) or which crash too often are replaced by a new JVM for each file.
+
+    :param action_path: Path where the snippet-scanner jars and FingerprintWorker.java are
+    :param size: Number of parallel workers (JVMs)
+    :param maxRestarts: How many times one crashed worker is restarted within restartWindow before giving up
+    :param restartWindow: Time window in seconds for maxRestarts
+    :param timeout: Max time in seconds to wait for the fingerprints of one file
+    '''
+    def __init__(self, action_path:str, size:int=1, maxRestarts:int=3, restartWindow:float=60, timeout:float=120) -> None:
+        self.action_path = action_path
+        self.size = max(1, size)
+        self.maxRestarts = maxRestarts
+        self.restartWindow = restartWindow
+        self.workers = queue.Queue()
+        for _ in range(self.size):
+            worker = FingerprintWorker(action_path, timeout)
+            self.__start(worker)
+            self.workers.put(worker)
+
+    def fingerprint(self, file:str) -> dict:
+        if "\n" in file or "\r" in file:
+            logging.error(f"File {file} cannot be fingerprinted by the worker, line breaks in the path.")
+            return None
+        worker = self.workers.get()
+        try:
+            for _ in range(2):
+                if not worker.isAlive() and not self.__restart(worker):
+                    return fingerprintWithNewJvm(file, self.action_path)
+                try:
+                    return worker.fingerprint(file)
+                except FingerprintWorkerError as e:
+                    logging.warning(e)
+                    worker.stop(graceful=False)
+                    if not worker.answered:
+                        # Worker has never answered, so it cannot run at all
+                        self.__disable(worker)
+                        return fingerprintWithNewJvm(file, self.action_path)
+            logging.error(f"File {file} failed in the fingerprint worker twice, skipping it.")
+            return None
+        finally:
+            self.workers.put(worker)
+
+    def __start(self, worker:FingerprintWorker) -> None:
+        try:
+            worker.start()
+        except OSError as e:
+            logging.error(f"Fingerprint worker could not be started: {e}")
+            self.__disable(worker)
+
+    def __restart(self, worker:FingerprintWorker) -> bool:
+        if worker.disabled:
+            return False
+        now = time.monotonic()
+        while worker.restarts and worker.restarts[0] < now - self.restartWindow:
+            worker.restarts.popleft()
+        if len(worker.restarts) >= self.maxRestarts:
+            logging.warning(f"Fingerprint worker crashed more than {self.maxRestarts} times in {self.restartWindow} seconds.")
+            self.__disable(worker)
+            return False
+        worker.restarts.append(now)
+        worker.stop()
+        self.__start(worker)
+        return not worker.disabled
+
+    def __disable(self, worker:FingerprintWorker) -> None:
+        worker.stop()
+        worker.disabled = True
+        logging.warning("Fingerprint worker is not used, starting a new JVM for each file instead.")
+
+    def close(self) -> None:
+        while not self.workers.empty():
+            self.workers.get().stop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
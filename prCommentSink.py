@@ -0,0 +1,149 @@
+import logging
+import time
+import queue
+import threading
+import github
+from scanMetrics import metrics
+
+__author__ = "Jouni Lehto"
+
+# Hidden marker which is used to find the comments of the earlier runs
+commentMarker = "<!-- blackduck-snippet-scanner -->"
+# GitHub comment body max length is 65536 characters
+maxCommentLength = 65536 - len(commentMarker) - 1
+commentSeparator = "\n\n"
+
+class PullRequestCommentSink:
+
+    '''
+    Collects the pull request comments of the scan and posts them from its own thread,
+    merged into as few comments as the GitHub comment length allows. Comments of the
+    earlier runs are updated instead of adding new ones, and the writes are paced by
+    the GitHub rate limits. PyGithub (GithubRetry) already waits on rate limit responses,
+    so the retries here only handle rate limits which outlast its retries.
+
+    :param githubClient: Github client, used to read the rate limits
+    :param pullRequest: Pull request for the comments
+    :param minInterval: Min time in seconds between two comment writes
+    :param maxRetries: How many times a rate limited write is retried
+    '''
+    def __init__(self, githubClient, pullRequest, minInterval:float=1.0, maxRetries:int=5) -> None:
+        self.github = githubClient
+        self.pullRequest = pullRequest
+        self.minInterval = minInterval
+        self.maxRetries = maxRetries
+        self.comments = queue.Queue()
+        self.thread = None
+        self.existingComments = None
+        self.usedComments = 0
+        self.lastWrite = 0
+
+    def add(self, comment:str) -> None:
+        if not self.thread:
+            self.thread = threading.Thread(target=self.__run, name="comments", daemon=True)
+            self.thread.start()
+        self.comments.put(comment)
+
+    def close(self, removeUnused:bool=True) -> None:
+        '''
+        Posts the queued comments and waits until they are posted.
+
+        :param removeUnused: Comments of the earlier runs which were not updated are removed, False when the scan
+        failed, so that the findings of the earlier run are not removed with an incomplete run
+        '''
+        if self.thread:
+            self.comments.put(None)
+            self.thread.join()
+            self.thread = None
+        if removeUnused:
+            self.__removeUnusedComments()
+
+    def __run(self) -> None:
+        body = []
+        bodyLength = 0
+        while True:
+            comment = self.comments.get()
+            if comment is None:
+                break
+            if len(comment) > maxCommentLength:
+                logging.warning(f"Comment is longer than {maxCommentLength} characters, it is truncated.")
+                comment = comment[:maxCommentLength - 20] + "\n\n*(truncated)*"
+            if body and bodyLength + len(commentSeparator) + len(comment) > maxCommentLength:
+                self.__post(commentSeparator.join(body))
+                body, bodyLength = [], 0
+            bodyLength += len(comment) + (len(commentSeparator) if body else 0)
+            body.append(comment)
+        if body:
+            self.__post(commentSeparator.join(body))
+
+    def __post(self, body:str) -> None:
+        try:
+            self.__loadExistingComments()
+            body = f"{commentMarker}\n{body}"
+            with metrics.stage("comments") as record:
+                record.bytesSent = len(body)
+                if self.usedComments < len(self.existingComments):
+                    self.__write(lambda: self.existingComments[self.usedComments].edit(body))
+                else:
+                    self.__write(lambda: self.pullRequest.create_issue_comment(body))
+            self.usedComments += 1
+        except github.GithubException as e:
+            logging.error(f"Creating pull request comment failed: {e}")
+
+    def __loadExistingComments(self) -> None:
+        if self.existingComments is None:
+            self.existingComments = [comment for comment in self.__write(lambda: list(self.pullRequest.get_issue_comments())) if comment.body and comment.body.startswith(commentMarker)]
+
+    def __removeUnusedComments(self) -> None:
+        try:
+            self.__loadExistingComments()
+        except github.GithubException as e:
+            logging.error(f"Reading old pull request comments failed: {e}")
+            return
+        # Comments of the earlier runs which are not needed anymore
+        for comment in self.existingComments[self.usedComments:]:
+            try:
+                self.__write(comment.delete)
+            except github.GithubException as e:
+                logging.error(f"Removing old pull request comment failed: {e}")
+
+    def __write(self, request):
+        attempt = 0
+        while True:
+            self.__pace()
+            try:
+                result = request()
+                self.lastWrite = time.time()
+                return result
+            except github.GithubException as e:
+                self.lastWrite = time.time()
+                delay = self.__rateLimitDelay(e)
+                # Other errors, like 403 for a token without pull request write permission, are not retried
+                if delay is not None and attempt < self.maxRetries:
+                    logging.warning(f"GitHub rate limit hit, retrying in {delay} seconds.")
+                    time.sleep(delay)
+                    attempt += 1
+                else:
+                    raise
+
+    def __rateLimitDelay(self, e:github.GithubException) -> int:
+        '''
+        Seconds to wait before retrying, None if the error is not a rate limit.
+        '''
+        headers = {name.lower(): value for name, value in (e.headers or {}).items()}
+        retryAfter = headers.get("retry-after")
+        if retryAfter is not None:
+            return int(retryAfter) if str(retryAfter).isdigit() else 60
+        if isinstance(e, github.RateLimitExceededException) or e.status == 429 or headers.get("x-ratelimit-remaining") == "0":
+            reset = headers.get("x-ratelimit-reset")
+            return max(1, int(reset) - int(time.time())) if reset and str(reset).isdigit() else 60
+        return None
+
+    def __pace(self) -> None:
+        delay = self.lastWrite + self.minInterval - time.time()
+        remaining, limit = self.github.rate_limiting
+        if limit > 0 and remaining < limit * 0.1:
+            # Spreading the rest of the requests until the rate limit resets
+            delay = max(delay, (self.github.rate_limiting_resettime - time.time()) / max(remaining, 1))
+        if delay > 0:
+            time.sleep(delay)
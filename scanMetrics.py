@@ -0,0 +1,139 @@
+import os
+import sys
+import logging
+import json
+import threading
+from contextlib import contextmanager
+from timeit import default_timer as timer
+
+__author__ = "Jouni Lehto"
+
+class StageRecord:
+
+    '''
+    One timed operation of a stage, bytes can be added while the operation is running.
+    '''
+    def __init__(self) -> None:
+        self.bytesSent = 0
+        self.bytesReceived = 0
+
+class ScanMetrics:
+
+    '''
+    Collects the per-stage timings of the scan run: count, total, p50, p95 and max
+    latencies and the bytes sent and received. Trace events for the Chrome trace-event
+    file are collected only if tracing is turned on.
+    '''
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.durations = {}
+        self.bytesSent = {}
+        self.bytesReceived = {}
+        self.traceEvents = None
+        self.started = timer()
+
+    def enableTracing(self) -> None:
+        self.traceEvents = []
+
+    @contextmanager
+    def stage(self, name:str):
+        record = StageRecord()
+        start = timer()
+        try:
+            yield record
+        finally:
+            self.record(name, start, timer() - start, record.bytesSent, record.bytesReceived)
+
+    def record(self, name:str, start:float, duration:float, bytesSent:int=0, bytesReceived:int=0) -> None:
+        with self.lock:
+            self.durations.setdefault(name, []).append(duration)
+            self.bytesSent[name] = self.bytesSent.get(name, 0) + bytesSent
+            self.bytesReceived[name] = self.bytesReceived.get(name, 0) + bytesReceived
+            if self.traceEvents is not None:
+                self.traceEvents.append({"name": name, "ph": "X", "ts": int((start - self.started) * 1000000), "dur": int(duration * 1000000),
+                                         "pid": os.getpid(), "tid": threading.get_ident()})
+
+    def __percentile(self, durations:list, percentile:int) -> float:
+        return durations[max(0, -(-len(durations) * percentile // 100) - 1)]
+
+    def toDict(self) -> dict:
+        stages = {}
+        with self.lock:
+            for name, durations in self.durations.items():
+                durations = sorted(durations)
+                stages[name] = {"count": len(durations), "total": round(sum(durations), 3), "p50": round(self.__percentile(durations, 50), 3),
+                                "p95": round(self.__percentile(durations, 95), 3), "max": round(durations[-1], 3),
+                                "bytesSent": self.bytesSent[name], "bytesReceived": self.bytesReceived[name]}
+        return stages
+
+    def createMarkdown(self) -> str:
+        metricsText = ["### Scan Metrics\n",
+                       "| Stage | Count | Total (s) | p50 (s) | p95 (s) | Max (s) | Sent (bytes) | Received (bytes) |\n",
+                       "| ----- | ----- | --------- | ------- | ------- | ------- | ------------ | ---------------- |\n"]
+        for name, stage in self.toDict().items():
+            metricsText.append(f'| {name} | {stage["count"]} | {stage["total"]} | {stage["p50"]} | {stage["p95"]} | {stage["max"]} | {stage["bytesSent"]} | {stage["bytesReceived"]} |\n')
+        return "".join(metricsText)
+
+    def writeJson(self, metricsFile:str) -> None:
+        with open(metricsFile, "w", encoding="UTF-8") as f:
+            f.write(json.dumps(self.toDict(), indent=3))
+
+    def writeTrace(self, traceFile:str) -> None:
+        with open(traceFile, "w", encoding="UTF-8") as f:
+            f.write(json.dumps({"traceEvents": self.traceEvents or []}))
+
+class ScanProfiler:
+
+    '''
+    cProfile of all threads of the scan run. Before Python 3.12 cProfile profiles only the thread
+    which enabled it, so every thread started after start() gets its own profiler and the profiles
+    are merged when they are dumped. From 3.12 on cProfile uses sys.monitoring, which covers all
+    threads but allows only one active profiler, so one profiler is used. Profiling errors are
+    logged and never stop the scan.
+    '''
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.profilers = []
+
+    def start(self) -> None:
+        if sys.version_info < (3, 12):
+            threading.setprofile(self.__startThread)
+        self.__enable()
+
+    def __startThread(self, frame, event, arg) -> None:
+        # Called for the first event of a new thread, the thread's own profiler replaces this hook
+        sys.setprofile(None)
+        try:
+            self.__enable()
+        except Exception as e:
+            # Error here would kill the thread before it runs, pool threads must always start
+            logging.warning(f"Profiling of thread {threading.current_thread().name} failed: {e}")
+
+    def __enable(self) -> None:
+        import cProfile
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e:
+            logging.warning(f"Profiling of thread {threading.current_thread().name} could not be started: {e}")
+            return
+        with self.lock:
+            self.profilers.append(profiler)
+
+    def stop(self) -> None:
+        threading.setprofile(None)
+        with self.lock:
+            for profiler in self.profilers:
+                profiler.disable()
+
+    def dumpStats(self, profileFile:str) -> None:
+        import pstats
+        try:
+            with self.lock:
+                stats = pstats.Stats(*self.profilers)
+            stats.dump_stats(profileFile)
+        except (TypeError, ValueError, OSError) as e:
+            logging.warning(f"Profile could not be written: {e}")
+
+# Metrics of the current scan run
+metrics = ScanMetrics()
@@ -0,0 +1,95 @@
+import logging
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+__author__ = "Jouni Lehto"
+
+FINGERPRINTS = "fingerprints"
+MATCHES = "matches"
+
+def hashFile(file:str) -> str:
+    sha = hashlib.sha256()
+    with open(file, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+class SnippetCache:
+
+    '''
+    Content-addressed cache for fingerprints and snippet-matching results. Entries are kept
+    in one SQLite file, so it can be saved and restored between runs with actions/cache.
+
+    :param cacheFile: SQLite file for the cache
+    :param ttl: Time to live for the entries in seconds
+    :param maxSize: Max size of the cached values in bytes, least recently used entries are evicted
+    '''
+    def __init__(self, cacheFile:str, ttl:int=7*24*60*60, maxSize:int=500*1024*1024) -> None:
+        self.ttl = ttl
+        self.maxSize = maxSize
+        self.lock = threading.Lock()
+        self.hits = {FINGERPRINTS: 0, MATCHES: 0}
+        self.misses = {FINGERPRINTS: 0, MATCHES: 0}
+        self.connection = sqlite3.connect(cacheFile, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS entries (kind TEXT, key TEXT, value TEXT, size INTEGER, created REAL, accessed REAL, PRIMARY KEY (kind, key))")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+        self.connection.execute("DELETE FROM entries WHERE created < ?", (time.time() - self.ttl,))
+        self.connection.commit()
+        self.size = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def get(self, kind:str, key:str) -> dict:
+        with self.lock:
+            row = self.connection.execute("SELECT value, created FROM entries WHERE kind = ? AND key = ?", (kind, key)).fetchone()
+            if row and row[1] >= time.time() - self.ttl:
+                self.connection.execute("UPDATE entries SET accessed = ? WHERE kind = ? AND key = ?", (time.time(), kind, key))
+                self.hits[kind] += 1
+                return json.loads(row[0])
+            self.misses[kind] += 1
+            return None
+
+    def put(self, kind:str, key:str, value:dict) -> None:
+        data = json.dumps(value)
+        now = time.time()
+        with self.lock:
+            old = self.connection.execute("SELECT size FROM entries WHERE kind = ? AND key = ?", (kind, key)).fetchone()
+            if old:
+                self.size -= old[0]
+            self.connection.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)", (kind, key, data, len(data), now, now))
+            self.size += len(data)
+            self.__evict()
+
+    def __evict(self) -> None:
+        while self.size > self.maxSize:
+            rows = self.connection.execute("SELECT kind, key, size FROM entries ORDER BY accessed LIMIT 100").fetchall()
+            if not rows:
+                self.size = 0
+                break
+            for kind, key, size in rows:
+                self.connection.execute("DELETE FROM entries WHERE kind = ? AND key = ?", (kind, key))
+                self.size -= size
+                if self.size <= self.maxSize:
+                    break
+
+    def getFingerprints(self, contentHash:str) -> dict:
+        return self.get(FINGERPRINTS, contentHash)
+
+    def putFingerprints(self, contentHash:str, fingerprints:dict) -> None:
+        self.put(FINGERPRINTS, contentHash, fingerprints)
+
+    def getMatches(self, url:str, contentHash:str) -> dict:
+        return self.get(MATCHES, f"{url}|{contentHash}")
+
+    def putMatches(self, url:str, contentHash:str, matches:dict) -> None:
+        self.put(MATCHES, f"{url}|{contentHash}", matches)
+
+    def logStatistics(self) -> None:
+        for kind in (FINGERPRINTS, MATCHES):
+            logging.info(f"Cache {kind}: {self.hits[kind]} hit(s), {self.misses[kind]} miss(es).")
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.commit()
+            self.connection.close()
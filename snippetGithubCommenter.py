@@ -1,74 +1,222 @@
 import logging
+import os
 import sys
-import github
+import base64
+import tarfile
+import subprocess
+from pathlib import Path
+from collections import deque
+from typing import Iterator
+from timeit import default_timer as timer
+from concurrent.futures import ThreadPoolExecutor
+from scanMetrics import metrics
 
 __author__ = "Jouni Lehto"
 
-supportedFileExtensions = ["py", "c", "h", "java", "ccp", "js", "go", ""]
+supportedFileExtensions = {"py", "c", "h", "java", "ccp", "js", "go", ""}
 
 class GihubCommenter:
 
-    def __init__(self, giturl:str, gittoken:str, repo:str, prID:int, group:bool, toolNameforSarif:str, log_level:str, version:str) -> None:
+    '''
+    :param listingMode: How all files are listed when no pull request is given, "tree" (one recursive git trees call),
+    "contents" (contents API walk) or "local" (files from the local checkout)
+    :param fetchConcurrency: Number of concurrent downloads of changed pull request files
+    :param archiveThreshold: When more changed files than this are missing locally, they are taken from one archive download
+    :param batchComments: Pull request comments are merged and posted from a background thread, earlier comments are updated
+    '''
+    def __init__(self, giturl:str, gittoken:str, repo:str, prID:int, group:bool, toolNameforSarif:str, log_level:str, version:str, listingMode:str="tree", fetchConcurrency:int=8, archiveThreshold:int=200, batchComments:bool=True) -> None:
         logging.basicConfig(format='%(asctime)s:%(levelname)s:%(module)s: %(message)s', stream=sys.stderr, level=log_level)
         logging.getLogger("requests").setLevel(logging.WARNING)
         logging.getLogger("urllib3").setLevel(logging.WARNING)
         self.__version__= version
-        if not gittoken:
+        # Local listing without a pull request doesn't need GitHub at all
+        if not gittoken and (prID or listingMode != "local"):
             logging.error("GitHub Access Token is not given. You need to give it with --gittoken")
             exit()
         self.token = gittoken
-        auth = github.Auth.Token(token=gittoken)
-        if giturl:
-            # Github Enterprise with custom hostname
-            self.giturl = giturl if not giturl.endswith("/") else giturl[:-1]
-            self.github = github.Github(auth=auth, base_url=f"{giturl}/api/v3")
-        else:
-            # Public Web Github
-            self.github = github.Github(auth=auth)
+        self.giturl = giturl if not giturl or not giturl.endswith("/") else giturl[:-1]
+        self.repoName = repo
+        self.htmlUrl = f"{self.giturl if self.giturl else 'https://github.com'}/{repo}"
+        self.prID = prID
         self.group = group
         self.toolNameforSarif = toolNameforSarif
-        self.repo = self.github.get_repo(repo)
-        if prID:
-            self.pullRequest = self.repo.get_pull(int(prID))
-            self.last_commit = self.pullRequest.get_commits()[self.pullRequest.commits - 1]
-            self.analysisFiles = self.__getChangedFiles()
-        else:
-            self.analysisFiles = self.__getAllFiles()
-        
-    def __getChangedFiles(self) -> list:
-        from pathlib import Path
-        files = []
+        self.listingMode = listingMode
+        self.fetchConcurrency = max(1, fetchConcurrency)
+        self.archiveThreshold = archiveThreshold
+        self.batchComments = batchComments
+        self.commentSink = None
+        self.commitSha = None
+        self.__github = None
+        self.__repo = None
+        self.__pullRequest = None
+        # Unified diffs of the changed pull request files, file -> patch
+        self.filePatches = {}
+        # Files are listed while the analysis iterates them, nothing is called before that
+        self.analysisFiles = self.__listFiles()
+
+    @property
+    def github(self):
+        if not self.__github:
+            import github
+            auth = github.Auth.Token(token=self.token)
+            if self.giturl:
+                # Github Enterprise with custom hostname
+                self.__github = github.Github(auth=auth, base_url=f"{self.giturl}/api/v3")
+            else:
+                # Public Web Github
+                self.__github = github.Github(auth=auth)
+        return self.__github
+
+    @property
+    def repo(self):
+        if not self.__repo:
+            # Lazy repository doesn't fetch the repository, only the calls made through it
+            self.__repo = self.github.get_repo(self.repoName, lazy=True)
+        return self.__repo
+
+    @property
+    def pullRequest(self):
+        if not self.__pullRequest and self.prID:
+            self.__pullRequest = self.repo.get_pull(int(self.prID))
+        return self.__pullRequest
+
+    def __listFiles(self) -> Iterator[str]:
+        files = self.__getChangedFiles() if self.prID else self.__getAllFiles()
+        # Only the time spent in the listing is recorded, not the analysis of the files given so far
+        start = timer()
+        duration = 0
+        while True:
+            listingStart = timer()
+            file = next(files, None)
+            duration += timer() - listingStart
+            if file is None:
+                break
+            yield file
+        metrics.record("listing", start, duration)
+
+    def __getChangedFiles(self) -> Iterator[str]:
+        from github import GithubException
+        changed = []
         try:
-            changedFiles = self.pullRequest.get_files()
             head_sha = self.pullRequest.head.sha
-            if changedFiles and changedFiles.totalCount > 0:
-                for file in changedFiles:
-                    if file.filename.split('.')[-1] in supportedFileExtensions:
-                        path = file.filename
-                        contents = self.repo.get_contents(path, ref=head_sha)
-                        content = contents.decoded_content.decode()
-                        output_file = Path(path)
-                        if not output_file.exists():
-                            output_file.parent.mkdir(exist_ok=True, parents=True)
-                            with open(output_file, "w", encoding="UTF-8") as f:
-                                f.write(content)
-                        files.append(path)
-        except github.GithubException:
+            self.commitSha = head_sha
+            # Files are given as soon as they are listed when the local checkout is at the pull request head
+            upToDate = self.__getLocalHead() == head_sha
+            if upToDate:
+                logging.debug(f"Local checkout is at {head_sha}, no need to download files.")
+            for file in self.pullRequest.get_files():
+                if file.filename.split('.')[-1] in supportedFileExtensions:
+                    if file.status == "removed":
+                        logging.debug(f"File {file.filename} is removed, skipping it.")
+                    elif file.patch is None and file.changes == 0 and file.status != "renamed":
+                        # GitHub gives no diff and no line changes for binary files
+                        logging.debug(f"File {file.filename} is binary, skipping it.")
+                    else:
+                        if file.patch:
+                            self.filePatches[file.filename] = file.patch
+                        if upToDate:
+                            yield file.filename
+                        else:
+                            changed.append(file)
+        except GithubException:
             logging.debug("No files changed or added.")
-        return files
+        if changed:
+            self.__fetchChangedFiles(changed, head_sha)
+            for file in changed:
+                yield file.filename
+
+    def __fetchChangedFiles(self, changedFiles:list, head_sha:str) -> None:
+        # Files which are already in the local checkout are not downloaded
+        missingFiles = [file for file in changedFiles if not Path(file.filename).exists()]
+        if len(missingFiles) > self.archiveThreshold:
+            logging.debug(f"{len(missingFiles)} files to download, downloading them from the archive.")
+            self.__fetchFromArchive(missingFiles, head_sha)
+        elif missingFiles:
+            with ThreadPoolExecutor(max_workers=self.fetchConcurrency, thread_name_prefix="fetch") as executor:
+                for _ in executor.map(self.__fetchBlob, missingFiles):
+                    pass
 
-    def __getAllFiles(self) -> list:
-        files = []
-        contents = self.repo.get_contents("")
+    def __getLocalHead(self) -> str:
+        try:
+            return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def __fetchBlob(self, file) -> None:
+        with metrics.stage("fetching") as record:
+            blob = self.repo.get_git_blob(file.sha)
+            content = base64.b64decode(blob.content)
+            record.bytesReceived = len(content)
+        self.__writeFile(file.filename, content)
+
+    def __fetchFromArchive(self, files:list, head_sha:str) -> None:
+        import requests
+        paths = {file.filename for file in files}
+        with metrics.stage("fetching") as record:
+            response = requests.get(self.repo.get_archive_link("tarball", ref=head_sha), stream=True)
+            response.raise_for_status()
+            with tarfile.open(fileobj=response.raw, mode="r|gz") as archive:
+                for member in archive:
+                    # Archive has one top level directory, <owner>-<repo>-<sha>/
+                    path = member.name.split("/", 1)[-1]
+                    if member.isfile() and path in paths:
+                        content = archive.extractfile(member).read()
+                        record.bytesReceived += len(content)
+                        self.__writeFile(path, content)
+
+    def __writeFile(self, path:str, content:bytes) -> None:
+        output_file = Path(path)
+        output_file.parent.mkdir(exist_ok=True, parents=True)
+        with open(output_file, "wb") as f:
+            f.write(content)
+
+    def __getAllFiles(self) -> Iterator[str]:
+        if self.listingMode == "local":
+            return self.__getLocalFiles()
+        elif self.listingMode == "contents":
+            return self.__getContentsFiles()
+        return self.__getTreeFiles()
+
+    def __getTreeFiles(self) -> Iterator[str]:
+        # Subtrees which are still to be listed, (path prefix, tree sha or HEAD of the default branch)
+        trees = deque([("", "HEAD")])
+        while trees:
+            prefix, sha = trees.popleft()
+            tree = self.repo.get_git_tree(sha, recursive=True)
+            truncated = tree.truncated
+            if truncated:
+                # Too big for one recursive call, listing this level only and the subtrees separately
+                logging.debug(f"Git tree {prefix if prefix else '/'} was truncated, listing subtrees separately.")
+                tree = self.repo.get_git_tree(sha)
+            for element in tree.tree:
+                path = f"{prefix}{element.path}"
+                if element.type == "blob":
+                    if path.split('.')[-1] in supportedFileExtensions:
+                        yield path
+                elif element.type == "tree" and truncated:
+                    trees.append((f"{path}/", element.sha))
+
+    def __getContentsFiles(self) -> Iterator[str]:
+        contents = deque(self.repo.get_contents(""))
         while contents:
-            file_content = contents.pop(0)
+            file_content = contents.popleft()
             logging.debug(file_content)
             if file_content.type == "dir":
                 contents.extend(self.repo.get_contents(file_content.path))
             else:
                 if file_content.path.split('.')[-1] in supportedFileExtensions:
-                    files.append(file_content.path)
-        return files
+                    yield file_content.path
+
+    def __getLocalFiles(self, root:str=".") -> Iterator[str]:
+        directories = deque([root])
+        while directories:
+            with os.scandir(directories.popleft()) as entries:
+                for entry in sorted(entries, key=lambda entry: entry.name):
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name != ".git":
+                            directories.append(entry.path)
+                    elif entry.is_file() and entry.name.split('.')[-1] in supportedFileExtensions:
+                        yield os.path.relpath(entry.path, root).replace(os.sep, "/")
 
     def createMarkdownComment(self, file:str, snippetResult:str) -> None:
         if self.group:
@@ -76,101 +224,122 @@ class GihubCommenter:
         else:
             self.__createSeparatedMarkdownComment(file, snippetResult)
 
-    def createSarif(self, snippetResultJson:str, url:str) -> str:
-        sarif_json = self.__getSarifJsonHeader()
-        snippets, rules = self.__getResults(snippetResultJson)
+    def createSarif(self, snippetResultJson:str, url:str, compact:bool=False) -> str:
+        '''
+        :param compact: Files are listed once in the run artifacts table and code flow locations refer to it by index
+        '''
+        sarif_json = self.getSarifJsonHeader()
+        snippets, rules = self.__getResults(snippetResultJson, compact)
         results = {}
         results['results'] = snippets
-        results['tool'] = self.__getSarifJsonFooter(rules, url)
+        results['tool'] = self.getSarifJsonFooter(rules, url)
+        if compact:
+            results['artifacts'] = self.getSarifArtifacts(snippetResultJson.keys())
         runs = []
         runs.append(results)
         sarif_json['runs'] = runs
         return sarif_json
 
     def createSummaryMarkdown(self, snippetResultJson:dict) -> str:
-        snippetResultJson = dict(snippetResultJson)
         summaryText = "## Snippet Analysis Results\n"
         if len(snippetResultJson.keys()) > 0:
-            summaryText += "\n\nThe following issues were found:</br>"
             reciprocal, unknown, permissive = 0, 0, 0
             for snippetResultFile in snippetResultJson.keys():
-                for licenseFamily in snippetResultJson[snippetResultFile]["snippetMatches"]:
-                    if "RECIPROCAL" in licenseFamily:
-                        reciprocal += len(snippetResultJson[snippetResultFile]["snippetMatches"][licenseFamily])
-                    elif "UNKNOWN" in licenseFamily:
-                        unknown += len(snippetResultJson[snippetResultFile]["snippetMatches"][licenseFamily])
-                    elif "PERMISSIVE" in licenseFamily:
-                        permissive += len(snippetResultJson[snippetResultFile]["snippetMatches"][licenseFamily])
-            if reciprocal > 0:
-                summaryText += f':x: {reciprocal} package(s) Reciprocal license(s)</br>'
-            else: 
-                summaryText += f':white_check_mark: {reciprocal} package(s) Reciprocal license(s)</br>'
-            if unknown > 0:
-                summaryText += f':warning: {unknown} package(s) Unknown license(s)</br>'
-            else:
-                summaryText += f':white_check_mark: {unknown} package(s) Unknown license(s)</br>'
-            if permissive > 0:    
-                summaryText += f':warning: {permissive} package(s) Permissive license(s)</br></br>'
-            else:
-                summaryText += f':white_check_mark: {permissive} package(s) Permissive license(s)</br></br>'
-            for snippetResultFile in snippetResultJson.keys():
-                summaryText += f'{self.__createGroupMarkDownComment(snippetResultFile, snippetResultJson[snippetResultFile], False)}\n'
+                fileReciprocal, fileUnknown, filePermissive = self.countLicenseFamilies(snippetResultJson[snippetResultFile])
+                reciprocal, unknown, permissive = reciprocal + fileReciprocal, unknown + fileUnknown, permissive + filePermissive
+            summaryText += self.createSummaryCounts(reciprocal, unknown, permissive)
+            summaryText += "".join([self.createSummaryFileMarkdown(snippetResultFile, snippetResultJson[snippetResultFile]) for snippetResultFile in snippetResultJson.keys()])
             summaryText += "### Scanned Files\n"
-            for snippetResultFile in snippetResultJson.keys():
-                summaryText += f"* {snippetResultFile}\n"
+            summaryText += "".join([f"* {snippetResultFile}\n" for snippetResultFile in snippetResultJson.keys()])
         else:
             summaryText += ":white_check_mark: No snippet matches found."
         return summaryText
 
-    def __getResults(self, snippetResultsJson:dict) -> list:
-        rules, results, ruleIds = [], [], []
-        snippetResultsJson = dict(snippetResultsJson)
-        for snippetResultFile in snippetResultsJson.keys():
-            for licenseFamily in snippetResultsJson[snippetResultFile]["snippetMatches"]:
-                for snippet in snippetResultsJson[snippetResultFile]["snippetMatches"][licenseFamily]:
-                    locations = []
-                    rule, result = {}, {}
-                    ruleId = f'License/{snippet["licenseDefinition"]["licenseDisplayName"]}/{licenseFamily}'                
-                    if not ruleId in ruleIds:
-                        rule = {"id":ruleId, "name": "Snippet Match", "helpUri": snippetResultsJson[snippetResultFile]['_meta']['links'][0]["href"], "shortDescription":{"text":f'{snippet["licenseDefinition"]["licenseDisplayName"]}'}, 
-                            "fullDescription":{"text":f'{snippet["licenseDefinition"]["licenseDisplayName"]}'},
-                            "help":{"text":f'{snippet["licenseDefinition"]["licenseDisplayName"]}', "markdown": f'{self.__createSnippetMarkdownRule(snippet, snippetResultFile, licenseFamily, None)}'}, 
-                            "properties": {"security-severity": self.__licenseFamilyToNumber(licenseFamily.upper()), "tags": self.__addLicenseTags()},
-                            "defaultConfiguration":{"level":self.__licenseFamilyToLevel(licenseFamily.upper())}}
-                        rules.append(rule)
-                        ruleIds.append(ruleId)
-                    result['message'] = {"text":self.__addMessage(snippet, None), "markdown":self.__addMessage(snippet, None)}
-                    result['ruleId'] = ruleId
-                    for idx, startLine in enumerate(snippet["regions"]["sourceStartLines"]):
-                        locations.append({"location":{"physicalLocation":{"artifactLocation":{"uri": snippetResultFile},"region":{"startLine":int(startLine), 
-                                        "endLine" :int(snippet["regions"]["sourceEndLines"][idx])}}, "message" : {"text": self.__addStepMessage(snippet, idx), "markdown": self.__addStepMessage(snippet, idx)}}})
-                    
-                    result['locations'] = [{"physicalLocation":{"artifactLocation":{"uri": snippetResultFile},"region":{"startLine":int(snippet["regions"]["sourceStartLines"][0])}}, 
-                                            "message" : {"text": "Snippet match found."}}]
-                    codeFlowsTable, loctionsFlowsTable = [], []
-                    threadFlows, loctionsFlows = {}, {}
-                    loctionsFlows['locations'] = locations
-                    loctionsFlowsTable.append(loctionsFlows)
-                    threadFlows['threadFlows'] = loctionsFlowsTable
-                    codeFlowsTable.append(threadFlows)
-                    result['codeFlows'] = codeFlowsTable
-                    results.append(result)
+    def countLicenseFamilies(self, snippetResult:dict) -> tuple:
+        reciprocal, unknown, permissive = 0, 0, 0
+        for licenseFamily in snippetResult["snippetMatches"]:
+            if "RECIPROCAL" in licenseFamily:
+                reciprocal += len(snippetResult["snippetMatches"][licenseFamily])
+            elif "UNKNOWN" in licenseFamily:
+                unknown += len(snippetResult["snippetMatches"][licenseFamily])
+            elif "PERMISSIVE" in licenseFamily:
+                permissive += len(snippetResult["snippetMatches"][licenseFamily])
+        return reciprocal, unknown, permissive
+
+    def createSummaryCounts(self, reciprocal:int, unknown:int, permissive:int) -> str:
+        summaryText = "\n\nThe following issues were found:</br>"
+        if reciprocal > 0:
+            summaryText += f':x: {reciprocal} package(s) Reciprocal license(s)</br>'
+        else: 
+            summaryText += f':white_check_mark: {reciprocal} package(s) Reciprocal license(s)</br>'
+        if unknown > 0:
+            summaryText += f':warning: {unknown} package(s) Unknown license(s)</br>'
+        else:
+            summaryText += f':white_check_mark: {unknown} package(s) Unknown license(s)</br>'
+        if permissive > 0:    
+            summaryText += f':warning: {permissive} package(s) Permissive license(s)</br></br>'
+        else:
+            summaryText += f':white_check_mark: {permissive} package(s) Permissive license(s)</br></br>'
+        return summaryText
+
+    def createSummaryFileMarkdown(self, file:str, snippetResult:dict) -> str:
+        return f'{self.__createGroupMarkDownComment(file, snippetResult, False)}\n'
+
+    def __getResults(self, snippetResultsJson:dict, compact:bool=False) -> list:
+        rules, results, ruleIds = [], [], set()
+        for artifactIndex, snippetResultFile in enumerate(snippetResultsJson.keys()):
+            fileResults, fileRules = self.getFileResults(snippetResultFile, snippetResultsJson[snippetResultFile], ruleIds, artifactIndex if compact else None)
+            results.extend(fileResults)
+            rules.extend(fileRules)
+        return results, rules
+
+    def getSarifArtifacts(self, files) -> list:
+        return [{"location":{"uri": file}} for file in files]
+
+    def getFileResults(self, snippetResultFile:str, snippetResult:dict, ruleIds:set, artifactIndex:int=None) -> tuple:
+        '''
+        Sarif results of one file and the rules which are not yet in ruleIds, ruleIds is updated.
+        With artifactIndex the code flow locations refer to the run artifacts table instead of repeating the file.
+        '''
+        rules, results = [], []
+        artifactLocation = {"uri": snippetResultFile} if artifactIndex is None else {"index": artifactIndex}
+        for licenseFamily in snippetResult["snippetMatches"]:
+            upperFamily = licenseFamily.upper()
+            for snippet in snippetResult["snippetMatches"][licenseFamily]:
+                licenseName = snippet["licenseDefinition"]["licenseDisplayName"]
+                ruleId = f'License/{licenseName}/{licenseFamily}'
+                if not ruleId in ruleIds:
+                    rules.append({"id":ruleId, "name": "Snippet Match", "helpUri": snippetResult['_meta']['links'][0]["href"], "shortDescription":{"text":licenseName}, 
+                        "fullDescription":{"text":licenseName},
+                        "help":{"text":licenseName, "markdown": self.__createSnippetMarkdownRule(snippet, snippetResultFile, licenseFamily, None)}, 
+                        "properties": {"security-severity": self.__licenseFamilyToNumber(upperFamily), "tags": self.__addLicenseTags()},
+                        "defaultConfiguration":{"level":self.__licenseFamilyToLevel(upperFamily)}})
+                    ruleIds.add(ruleId)
+                message = self.__addMessage(snippet, None)
+                regions = snippet["regions"]
+                locations = []
+                for idx, startLine in enumerate(regions["sourceStartLines"]):
+                    stepMessage = self.__addStepMessage(snippet, idx)
+                    locations.append({"location":{"physicalLocation":{"artifactLocation":artifactLocation,"region":{"startLine":int(startLine), 
+                                    "endLine" :int(regions["sourceEndLines"][idx])}}, "message" : {"text": stepMessage, "markdown": stepMessage}}})
+                results.append({"message": {"text":message, "markdown":message}, "ruleId": ruleId,
+                                "locations": [{"physicalLocation":{"artifactLocation":{"uri": snippetResultFile},"region":{"startLine":int(regions["sourceStartLines"][0])}}, 
+                                               "message" : {"text": "Snippet match found."}}],
+                                "codeFlows": [{"threadFlows": [{"locations": locations}]}]})
         return results, rules
 
     def __addStepMessage(self, snippet, idx) -> str:
-        message = f'Matched file: {snippet["matchedFilePath"]}, lines: '
-        message += f'start: {snippet["regions"]["matchedStartLines"][idx]}, end: {snippet["regions"]["matchedEndLines"][idx]}'
-        return message
+        return f'Matched file: {snippet["matchedFilePath"]}, lines: start: {snippet["regions"]["matchedStartLines"][idx]}, end: {snippet["regions"]["matchedEndLines"][idx]}'
 
     def __addMessage(self, snippet, idx) -> str:
-        message = f'### Snippet match found.</br>'
-        message += f'<b>Matched OSS Library:</b> {snippet["projectName"]}</br>'
-        message += f'<b>Matched OSS Library version:</b> {snippet["releaseVersion"]}</br>'
-        message += f'<b>Matched OSS Library License:</b> {snippet["licenseDefinition"]["licenseDisplayName"]}</br>'
-        message += f'<b>Matched file:</b> {snippet["matchedFilePath"]}</br>'
+        message = [f'### Snippet match found.</br>',
+                   f'<b>Matched OSS Library:</b> {snippet["projectName"]}</br>',
+                   f'<b>Matched OSS Library version:</b> {snippet["releaseVersion"]}</br>',
+                   f'<b>Matched OSS Library License:</b> {snippet["licenseDefinition"]["licenseDisplayName"]}</br>',
+                   f'<b>Matched file:</b> {snippet["matchedFilePath"]}</br>']
         if idx:
-            message += f'<b>Matched lines in OSS file: start:</b> {snippet["regions"]["matchedStartLines"][idx]}, <b>end:</b> {snippet["regions"]["matchedEndLines"][idx]}</br>'
-        return message
+            message.append(f'<b>Matched lines in OSS file: start:</b> {snippet["regions"]["matchedStartLines"][idx]}, <b>end:</b> {snippet["regions"]["matchedEndLines"][idx]}</br>')
+        return "".join(message)
 
     def __addLicenseTags(self) -> list:
         tags = []
@@ -200,63 +369,86 @@ class GihubCommenter:
                 return "1.0"
         return "0.0"
 
-    def __getSarifJsonHeader(self) -> dict:
+    def getSarifJsonHeader(self) -> dict:
         return {"$schema":"https://raw.githubusercontent.com/oasis-tcs/sarif-spec/master/Schemata/sarif-schema-2.1.0.json","version":"2.1.0"}
 
-    def __getSarifJsonFooter(self, rules:list, url:str) -> dict:
+    def getSarifJsonFooter(self, rules:list, url:str) -> dict:
         return {"driver":{"name":self.toolNameforSarif,"informationUri": f'{url if url else ""}',"version":self.__version__,"organization":"Black Duck","rules":rules}}
 
     def __createSeparatedMarkdownComment(self, file:str, snippetResult:str) -> None:
         if snippetResult:
             for licenseFamily in snippetResult["snippetMatches"]:
-                fileUrl = f"{self.repo.html_url}/blob/{self.last_commit.sha}/{file}"
+                fileUrl = self.__getFileUrl(file)
                 for snippet in snippetResult["snippetMatches"][licenseFamily]:
                     self.__addSnippetComment(self.__createSnippetMarkdown(snippet, file, licenseFamily, fileUrl))
     
+    def __getFileUrl(self, file:str) -> str:
+        if not self.commitSha:
+            if self.pullRequest:
+                self.commitSha = self.pullRequest.head.sha
+            elif self.listingMode == "local":
+                self.commitSha = self.__getLocalHead()
+        # Without a commit the files are linked to the default branch
+        return f"{self.htmlUrl}/blob/{self.commitSha if self.commitSha else 'HEAD'}/{file}"
+
     def __createSnippetMarkdown(self, snippet:dict, file:str, licenseFamily:str, fileUrl:str) -> str:
-        if fileUrl:
-            snippet_comment = f'**Snippet analysis has found following match from file: [{file}]({fileUrl})**\n\n'
-        else:
-            snippet_comment = f'## Snippet analysis has found following match\n\n'
-        snippet_comment += f'**License family:** {":warning:" if "RECIPROCAL" in licenseFamily or "UNKNOWN" in licenseFamily else ""}{licenseFamily}\n'
-        snippet_comment += f'**Name:** {snippet["projectName"]}\n'
-        snippet_comment += f'**Version:** {snippet["releaseVersion"]}\n'
-        snippet_comment += f'**License:** {snippet["licenseDefinition"]["licenseDisplayName"]}\n'
-        snippet_comment += f'**Matched file:** {snippet["matchedFilePath"]}\n'
-        snippet_comment += f'**Matched lines:** start: {snippet["regions"]["sourceStartLines"]}, end: {snippet["regions"]["sourceEndLines"]}'
-        return snippet_comment
+        snippet_comment = [self.__createSnippetMarkdownRule(snippet, file, licenseFamily, fileUrl),
+                           f'**Matched file:** {snippet["matchedFilePath"]}\n',
+                           f'**Matched lines:** start: {snippet["regions"]["sourceStartLines"]}, end: {snippet["regions"]["sourceEndLines"]}']
+        return "".join(snippet_comment)
     
     def __createSnippetMarkdownRule(self, snippet:dict, file:str, licenseFamily:str, fileUrl:str) -> str:
         if fileUrl:
-            snippet_comment = f'**Snippet analysis has found following match from file: [{file}]({fileUrl})**\n\n'
+            snippet_comment = [f'**Snippet analysis has found following match from file: [{file}]({fileUrl})**\n\n']
         else:
-            snippet_comment = f'## Snippet analysis has found following match\n\n'
-        snippet_comment += f'**License family:** {":warning:" if "RECIPROCAL" in licenseFamily or "UNKNOWN" in licenseFamily else ""}{licenseFamily}\n'
-        snippet_comment += f'**Name:** {snippet["projectName"]}\n'
-        snippet_comment += f'**Version:** {snippet["releaseVersion"]}\n'
-        snippet_comment += f'**License:** {snippet["licenseDefinition"]["licenseDisplayName"]}\n'
-        return snippet_comment
+            snippet_comment = [f'## Snippet analysis has found following match\n\n']
+        snippet_comment.append(f'**License family:** {":warning:" if "RECIPROCAL" in licenseFamily or "UNKNOWN" in licenseFamily else ""}{licenseFamily}\n')
+        snippet_comment.append(f'**Name:** {snippet["projectName"]}\n')
+        snippet_comment.append(f'**Version:** {snippet["releaseVersion"]}\n')
+        snippet_comment.append(f'**License:** {snippet["licenseDefinition"]["licenseDisplayName"]}\n')
+        return "".join(snippet_comment)
 
     def __createGroupMarkDownComment(self, file:str, snippetResult:str, addSnippet=True) -> None:
-        snippet_comment = ""
+        snippet_comment = []
         if snippetResult:
-            fileUrl = f"{self.repo.html_url}/blob/{self.last_commit.sha}/{file}"
-            snippet_comment += f'**Snippet analysis has found following matches from file: [{file}]({fileUrl})**\n\n'
-            snippet_comment += f'| License Family | Component | License | Match info |\n'
-            snippet_comment += f'| -------------- | --------- | ------- | ---------- |\n'
+            fileUrl = self.__getFileUrl(file)
+            snippet_comment.append(f'**Snippet analysis has found following matches from file: [{file}]({fileUrl})**\n\n')
+            snippet_comment.append(f'| License Family | Component | License | Match info |\n')
+            snippet_comment.append(f'| -------------- | --------- | ------- | ---------- |\n')
             for licenseFamily in snippetResult["snippetMatches"]:
+                familyText = f'| {":warning:" if "RECIPROCAL" in licenseFamily or "UNKNOWN" in licenseFamily else ""}{licenseFamily} | '
                 for snippet in snippetResult["snippetMatches"][licenseFamily]:
-                    snippet_comment += f'| {":warning:" if "RECIPROCAL" in licenseFamily or "UNKNOWN" in licenseFamily else ""}{licenseFamily} | '
-                    snippet_comment += f'**Name:** {snippet["projectName"]}</br>**Version:** {snippet["releaseVersion"]} | '
-                    snippet_comment += f'{snippet["licenseDefinition"]["licenseDisplayName"]} | '
-                    snippet_comment += f'**Matched file:** {snippet["matchedFilePath"]}</br>'
-                    snippet_comment += f'**Matched lines:** start: {snippet["regions"]["sourceStartLines"]}, end: {snippet["regions"]["sourceEndLines"]} |\n'
+                    snippet_comment.append(familyText)
+                    snippet_comment.append(f'**Name:** {snippet["projectName"]}</br>**Version:** {snippet["releaseVersion"]} | ')
+                    snippet_comment.append(f'{snippet["licenseDefinition"]["licenseDisplayName"]} | ')
+                    snippet_comment.append(f'**Matched file:** {snippet["matchedFilePath"]}</br>')
+                    snippet_comment.append(f'**Matched lines:** start: {snippet["regions"]["sourceStartLines"]}, end: {snippet["regions"]["sourceEndLines"]} |\n')
         if addSnippet:
-            self.__addSnippetComment(snippet_comment)
+            self.__addSnippetComment("".join(snippet_comment))
         else:
-            return  snippet_comment
+            return "".join(snippet_comment)
 
     def __addSnippetComment(self, comment:str) -> None:
-        if self.pullRequest:
-            self.pullRequest.create_issue_comment(comment)
+        if self.batchComments and self.pullRequest:
+            self.__getCommentSink().add(comment)
+        elif self.pullRequest:
+            with metrics.stage("comments") as record:
+                record.bytesSent = len(comment)
+                self.pullRequest.create_issue_comment(comment)
+
+    def __getCommentSink(self):
+        if not self.commentSink:
+            from prCommentSink import PullRequestCommentSink
+            self.commentSink = PullRequestCommentSink(self.github, self.pullRequest)
+        return self.commentSink
+
+    def closeComments(self, removeUnused:bool=True) -> None:
+        '''
+        Waits until all queued pull request comments are posted. Comments of the earlier
+        runs which are not needed anymore are removed, also when nothing was commented.
+
+        :param removeUnused: False when the scan failed, comments of the earlier runs are kept
+        '''
+        if self.batchComments and self.pullRequest:
+            self.__getCommentSink().close(removeUnused)
             
\ No newline at end of file
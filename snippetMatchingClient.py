@@ -0,0 +1,104 @@
+import logging
+import json
+import gzip
+import time
+import random
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from scanMetrics import metrics
+
+__author__ = "Jouni Lehto"
+
+# Black Duck server url -> semaphore, shared by all clients of the process
+serverLimits = {}
+serverLimitsLock = threading.Lock()
+
+def getServerLimit(url:str, maxConcurrency:int) -> threading.BoundedSemaphore:
+    with serverLimitsLock:
+        if not url in serverLimits:
+            serverLimits[url] = threading.BoundedSemaphore(max(1, maxConcurrency))
+        return serverLimits[url]
+
+class SnippetMatchingClient:
+
+    '''
+    Client for the Black Duck snippet-matching API. All requests go through one pooled
+    keep-alive session, so connections (and TLS handshakes) are reused between files.
+    The endpoint takes the fingerprints of one file per request.
+
+    :param hub: HubInstance which is used for the authentication
+    :param url: BD Url
+    :param maxConcurrency: Max number of concurrent requests to the Black Duck server
+    :param maxRetries: How many times a request is retried when server responds with 429, 502, 503 or 504
+    :param compress: Request bodies are gzip compressed, turned off if the server doesn't accept it
+    '''
+    def __init__(self, hub, url:str, maxConcurrency:int=8, maxRetries:int=5, compress:bool=False) -> None:
+        self.hub = hub
+        self.api = f"{url}/api/snippet-matching"
+        self.serverLimit = getServerLimit(url, maxConcurrency)
+        self.maxRetries = maxRetries
+        self.compress = compress
+        self.session = requests.Session()
+        self.session.verify = not hub.config['insecure']
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, maxConcurrency))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.headers = self.__getHeaders()
+
+    def __getHeaders(self) -> dict:
+        headers = self.hub.get_headers()
+        headers["Content-Type"] = "application/vnd.blackducksoftware.bill-of-materials-6+json"
+        return headers
+
+    def match(self, fingerprints:dict) -> dict:
+        with metrics.stage("matching") as record:
+            return self.__match(fingerprints, record)
+
+    def __match(self, fingerprints:dict, record) -> dict:
+        data = json.dumps(fingerprints).encode("UTF-8")
+        attempt = 0
+        while True:
+            compressed = self.compress
+            headers = dict(self.headers)
+            if compressed:
+                headers["Content-Encoding"] = "gzip"
+            try:
+                body = gzip.compress(data) if compressed else data
+                record.bytesSent += len(body)
+                with self.serverLimit:
+                    response = self.session.post(self.api, headers=headers, data=body)
+                record.bytesReceived += len(response.content)
+            except requests.ConnectionError as e:
+                if attempt >= self.maxRetries:
+                    raise
+                delay = self.__retryDelay(None, attempt)
+                logging.warning(f"Connection to Black Duck failed: {e}, retrying in {delay:.1f} seconds.")
+                time.sleep(delay)
+                attempt += 1
+                continue
+            if compressed and response.status_code in (400, 415):
+                logging.warning(f"Black Duck responded with {response.status_code} to a compressed request, sending requests uncompressed.")
+                self.compress = False
+            elif response.status_code == 401 and attempt < self.maxRetries:
+                logging.debug("Black Duck token expired, authenticating again.")
+                self.hub.token, self.hub.csrf_token, self.hub.cookie = self.hub.get_auth_token()
+                self.headers = self.__getHeaders()
+                attempt += 1
+            elif response.status_code in (429, 502, 503, 504) and attempt < self.maxRetries:
+                delay = self.__retryDelay(response, attempt)
+                logging.warning(f"Black Duck responded with {response.status_code}, retrying in {delay:.1f} seconds.")
+                time.sleep(delay)
+                attempt += 1
+            else:
+                return response.json()
+
+    def __retryDelay(self, response, attempt:int) -> float:
+        retryAfter = response.headers.get("Retry-After") if response is not None else None
+        if retryAfter and retryAfter.isdigit():
+            return int(retryAfter)
+        # Full jitter, so that the concurrent requests won't retry at the same time
+        return random.uniform(0, min(60, 2 ** attempt))
+
+    def close(self) -> None:
+        self.session.close()
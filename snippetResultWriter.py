@@ -0,0 +1,102 @@
+import json
+import shutil
+import tempfile
+
+__author__ = "Jouni Lehto"
+
+class NdjsonResultWriter:
+
+    '''
+    Writes the snippet-matching results as soon as a file is analyzed, one json line per file.
+
+    :param resultFile: File for the results
+    '''
+    def __init__(self, resultFile:str) -> None:
+        self.output = open(resultFile, "w", encoding="UTF-8")
+
+    def write(self, file:str, snippetResult:dict) -> None:
+        self.output.write(json.dumps({"file": file, "result": snippetResult}))
+        self.output.write("\n")
+
+    def close(self) -> None:
+        self.output.close()
+
+class SarifResultWriter:
+
+    '''
+    Writes the sarif results as soon as a file is analyzed. Deduplicated rules are
+    kept in memory and written at the end of the run.
+
+    :param resultFile: File for the sarif report
+    :param gitcommenter: GihubCommenter which creates the sarif results
+    :param url: BD Url for the sarif tool information
+    :param compact: Files are listed once in the run artifacts table and code flow locations refer to it by index
+    '''
+    def __init__(self, resultFile:str, gitcommenter, url:str, compact:bool=False) -> None:
+        self.gitcommenter = gitcommenter
+        self.url = url
+        self.compact = compact
+        self.files = []
+        self.rules, self.ruleIds = [], set()
+        self.firstResult = True
+        self.output = open(resultFile, "w", encoding="UTF-8")
+        header = json.dumps(gitcommenter.getSarifJsonHeader())
+        # Header without the closing brace, runs and results are written after it
+        self.output.write(f'{header[:-1]}, "runs": [{{"results": [')
+
+    def write(self, file:str, snippetResult:dict) -> None:
+        results, rules = self.gitcommenter.getFileResults(file, snippetResult, self.ruleIds, len(self.files) if self.compact else None)
+        if self.compact:
+            self.files.append(file)
+        self.rules.extend(rules)
+        for result in results:
+            if not self.firstResult:
+                self.output.write(",")
+            self.output.write(json.dumps(result, separators=(",", ":")) if self.compact else json.dumps(result))
+            self.firstResult = False
+
+    def close(self) -> None:
+        self.output.write(f'], "tool": {json.dumps(self.gitcommenter.getSarifJsonFooter(self.rules, self.url))}')
+        if self.compact:
+            self.output.write(f', "artifacts": {json.dumps(self.gitcommenter.getSarifArtifacts(self.files), separators=(",", ":"))}')
+        self.output.write('}]}')
+        self.output.close()
+
+class SummaryMarkdownWriter:
+
+    '''
+    Creates the same summary markdown as GihubCommenter.createSummaryMarkdown, but the license
+    counters are updated as the results arrive and the file sections are kept in temporary files.
+
+    :param summaryFile: File for the summary markdown
+    :param gitcommenter: GihubCommenter which creates the markdown
+    '''
+    def __init__(self, summaryFile:str, gitcommenter) -> None:
+        self.summaryFile = summaryFile
+        self.gitcommenter = gitcommenter
+        self.reciprocal, self.unknown, self.permissive = 0, 0, 0
+        self.fileCount = 0
+        self.sections = tempfile.TemporaryFile("w+", encoding="UTF-8")
+        self.scannedFiles = tempfile.TemporaryFile("w+", encoding="UTF-8")
+
+    def write(self, file:str, snippetResult:dict) -> None:
+        reciprocal, unknown, permissive = self.gitcommenter.countLicenseFamilies(snippetResult)
+        self.reciprocal, self.unknown, self.permissive = self.reciprocal + reciprocal, self.unknown + unknown, self.permissive + permissive
+        self.fileCount += 1
+        self.sections.write(self.gitcommenter.createSummaryFileMarkdown(file, snippetResult))
+        self.scannedFiles.write(f"* {file}\n")
+
+    def close(self) -> None:
+        with open(self.summaryFile, "w", encoding="UTF-8") as summary:
+            summary.write("## Snippet Analysis Results\n")
+            if self.fileCount > 0:
+                summary.write(self.gitcommenter.createSummaryCounts(self.reciprocal, self.unknown, self.permissive))
+                self.sections.seek(0)
+                shutil.copyfileobj(self.sections, summary)
+                summary.write("### Scanned Files\n")
+                self.scannedFiles.seek(0)
+                shutil.copyfileobj(self.scannedFiles, summary)
+            else:
+                summary.write(":white_check_mark: No snippet matches found.")
+        self.sections.close()
+        self.scannedFiles.close()
@@ -0,0 +1,80 @@
+import logging
+import os
+import json
+import hashlib
+from typing import Iterator
+
+__author__ = "Jouni Lehto"
+
+def parseShard(shard:str) -> tuple:
+    '''
+    Parses the shard given as i/N, where i is 1..N.
+    '''
+    try:
+        shardIndex, shardCount = [int(value) for value in shard.split("/")]
+    except ValueError:
+        raise ValueError(f"Shard must be given as i/N, for example 1/4, not {shard}")
+    if shardCount < 1:
+        raise ValueError(f"Shard count must be at least 1, not {shardCount}")
+    if shardIndex < 1 or shardIndex > shardCount:
+        raise ValueError(f"Shard index must be between 1 and {shardCount}, not {shardIndex}")
+    return shardIndex, shardCount
+
+def selectShard(files:Iterator[str], shardIndex:int, shardCount:int, weighted:bool=False) -> Iterator[str]:
+    '''
+    Files of the given shard. Every runner gets the same partitioning for the same file list:
+    by a stable hash of the path, or with weighted the files are spread by size so that
+    every shard gets about the same amount of content. Hash partitioning gives the files
+    while they are listed, weighted partitioning needs the whole list first.
+    '''
+    if weighted:
+        files = list(files)
+        loads = [0] * shardCount
+        shards = [set() for _ in range(shardCount)]
+        # Every file weighs at least 1, so files without a local size are spread evenly
+        sizes = {file: max(os.path.getsize(file) if os.path.isfile(file) else 0, 1) for file in files}
+        for file in sorted(files, key=lambda file: (-sizes[file], file)):
+            shard = min(range(shardCount), key=lambda shard: (loads[shard], shard))
+            loads[shard] += sizes[file]
+            shards[shard].add(file)
+        inShard = lambda file: file in shards[shardIndex - 1]
+    else:
+        inShard = lambda file: int(hashlib.sha1(file.encode("UTF-8")).hexdigest(), 16) % shardCount == shardIndex - 1
+    selected = total = 0
+    for file in files:
+        total += 1
+        if inShard(file):
+            selected += 1
+            yield file
+    logging.info(f"Shard {shardIndex}/{shardCount} had {selected} of {total} files.")
+
+def readPartialResults(resultFile:str) -> dict:
+    '''
+    Reads the results of one shard, written either as json or as json lines (--streamResults).
+    '''
+    with open(resultFile, "r", encoding="UTF-8") as f:
+        lines = [line for line in f if line.strip()]
+    if not lines:
+        return {}
+    try:
+        firstLine = json.loads(lines[0])
+    except json.JSONDecodeError:
+        firstLine = None
+    # Json lines have one {"file": ..., "result": ...} object per line, in json results the values are results
+    if isinstance(firstLine, dict) and set(firstLine) == {"file", "result"} and isinstance(firstLine["file"], str):
+        results = {}
+        for line in lines:
+            fileResult = json.loads(line)
+            results[fileResult["file"]] = fileResult["result"]
+        return results
+    results = json.loads("".join(lines))
+    if "runs" in results:
+        raise ValueError(f"{resultFile} is a sarif file, shards must write json results.")
+    return results
+
+def mergePartialResults(resultFiles:list) -> dict:
+    merged = {}
+    for resultFile in resultFiles:
+        merged.update(readPartialResults(resultFile))
+    # Same order regardless of the order of the shards
+    return {file: merged[file] for file in sorted(merged)}
@@ -0,0 +1,75 @@
+import os
+import re
+
+__author__ = "Jouni Lehto"
+
+hunkHeader = re.compile(r"^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@", re.MULTILINE)
+
+def getChangedRanges(patch:str, contextLines:int, lineCount:int) -> list:
+    '''
+    Lines of the new file version which are covered by the hunks of the given unified diff,
+    widened with contextLines. Overlapping ranges are merged, lines are 1-based and inclusive.
+    '''
+    ranges = []
+    for match in hunkHeader.finditer(patch):
+        start = int(match.group(1))
+        count = int(match.group(2)) if match.group(2) is not None else 1
+        end = start + count - 1 if count > 0 else start
+        ranges.append((max(1, start - contextLines), min(lineCount, end + contextLines)))
+    merged = []
+    for start, end in sorted(ranges):
+        if start > end:
+            continue
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def readLines(file:str) -> list:
+    with open(file, "r", encoding="UTF-8", errors="replace") as f:
+        return f.readlines()
+
+def writeWindow(lines:list, start:int, end:int, directory:str, name:str) -> str:
+    path = os.path.join(directory, name)
+    with open(path, "w", encoding="UTF-8") as f:
+        f.writelines(lines[start-1:end])
+    return path
+
+def offsetRegions(results:dict, offset:int) -> dict:
+    '''
+    Maps the source line regions of the snippet matches of one window back to the original file.
+    Results are changed in place.
+    '''
+    if offset and results and "snippetMatches" in results:
+        for licenseFamily in results["snippetMatches"]:
+            for snippet in results["snippetMatches"][licenseFamily]:
+                regions = snippet["regions"]
+                regions["sourceStartLines"] = [int(line) + offset for line in regions["sourceStartLines"]]
+                regions["sourceEndLines"] = [int(line) + offset for line in regions["sourceEndLines"]]
+    return results
+
+def mergeResults(resultsList:list) -> dict:
+    '''
+    Combines the snippet matches of several windows of one file. Same match found
+    from several windows is reported once with the regions of all windows.
+    '''
+    resultsList = [results for results in resultsList if results and "snippetMatches" in results]
+    if len(resultsList) == 0:
+        return None
+    if len(resultsList) == 1:
+        return resultsList[0]
+    merged = dict(resultsList[0])
+    merged["snippetMatches"] = {}
+    snippets = {}
+    for results in resultsList:
+        for licenseFamily in results["snippetMatches"]:
+            for snippet in results["snippetMatches"][licenseFamily]:
+                key = (licenseFamily, snippet["projectName"], snippet["releaseVersion"], snippet["matchedFilePath"])
+                if key in snippets:
+                    for region in ("sourceStartLines", "sourceEndLines", "matchedStartLines", "matchedEndLines"):
+                        snippets[key]["regions"][region] = snippets[key]["regions"][region] + snippet["regions"][region]
+                else:
+                    snippets[key] = snippet
+                    merged["snippetMatches"].setdefault(licenseFamily, []).append(snippet)
+    return merged